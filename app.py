@@ -6,104 +6,146 @@
 """
 
 import os
-import sys
-import signal
+import io
+import errno
+import hashlib
+import uuid
+import contextlib
 import socket
-from flask import Flask, render_template, request, send_file, jsonify
+import psutil
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
+from urllib.parse import unquote
 import tempfile
 import shutil
-from datetime import datetime
 
-# 导入核心格式化函数
-from gongwen_formatter_cli import format_document
-from llm_formatter import llm_format_document
+# 导入后台任务队列
+from tasks import (submit_task, get_task_status, start_workers, shutdown_workers, check_ready,
+                   remove_file, SUCCESS, FAILURE)
+
+# orjson（可选）：C实现的JSON序列化，未安装时使用Flask默认的json模块
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """使用 orjson 序列化 jsonify 的响应"""
+    
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB 最大文件大小
-app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+# 临时文件优先放在内存文件系统（Linux 的 /dev/shm），上传和输出文件都不落盘
+SHM_DIR = '/dev/shm'
+if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+    app.config['UPLOAD_FOLDER'] = SHM_DIR
+else:
+    app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
 
 ALLOWED_EXTENSIONS = {'docx'}
+UPLOAD_CHUNK_SIZE = 1 << 20  # 流式上传每次读取1MB
+DOWNLOAD_CHUNK_SIZE = 512 * 1024  # 下载每次发送512KB
+SENDFILE_BLOCK_SIZE = 64 * 1024  # file_wrapper 块大小
+
+def find_port_pids(port):
+    """查找正在监听指定端口的进程PID"""
+    try:
+        connections = psutil.net_connections(kind='tcp')
+    except psutil.AccessDenied:
+        # macOS 上读取全部连接需要root权限，改为逐个检查当前用户可访问的进程
+        pids = set()
+        for proc in psutil.process_iter():
+            try:
+                for conn in proc.net_connections(kind='tcp'):
+                    if conn.laddr and conn.laddr.port == port and conn.status == psutil.CONN_LISTEN:
+                        pids.add(proc.pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return pids
+    
+    return {
+        conn.pid for conn in connections
+        if conn.pid and conn.laddr and conn.laddr.port == port and conn.status == psutil.CONN_LISTEN
+    }
+
+def port_in_use(port):
+    """尝试绑定端口判断是否被占用（不向端口发起连接）"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        # 与开发服务器一致使用 SO_REUSEADDR，TIME_WAIT 状态不算占用
+        # （Windows 上该选项允许抢占端口，不能设置）
+        if os.name != 'nt':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('0.0.0.0', port))
+    except OSError as e:
+        return e.errno == errno.EADDRINUSE
+    finally:
+        sock.close()
+    return False
 
 def check_and_kill_port(port):
     """检查端口是否被占用，如果占用则尝试释放"""
     try:
-        # 检查端口是否被占用
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex(('localhost', port))
-        sock.close()
-        
-        if result == 0:
-            print(f"⚠️  端口 {port} 已被占用，尝试释放...")
-            
-            # macOS/Linux
-            if sys.platform != 'win32':
-                try:
-                    import subprocess
-                    # 查找占用端口的进程
-                    result = subprocess.run(
-                        ['lsof', '-ti', f':{port}'],
-                        capture_output=True,
-                        text=True
-                    )
-                    pids = result.stdout.strip().split('\n')
-                    
-                    # 终止这些进程
-                    for pid in pids:
-                        if pid:
-                            try:
-                                os.kill(int(pid), signal.SIGTERM)
-                                print(f"  ✅ 已终止进程 {pid}")
-                            except:
-                                pass
-                    
-                    import time
-                    time.sleep(1)
-                    print(f"  ✅ 端口 {port} 已释放")
-                    return True
-                except Exception as e:
-                    print(f"  ❌ 无法自动释放端口: {e}")
-                    return False
-            
-            # Windows
-            else:
-                try:
-                    import subprocess
-                    # 查找占用端口的进程
-                    result = subprocess.run(
-                        ['netstat', '-ano', '-p', 'TCP'],
-                        capture_output=True,
-                        text=True
-                    )
-                    
-                    for line in result.stdout.split('\n'):
-                        if f':{port}' in line and 'LISTENING' in line:
-                            parts = line.split()
-                            pid = parts[-1]
-                            try:
-                                subprocess.run(['taskkill', '/F', '/PID', pid], check=True)
-                                print(f"  ✅ 已终止进程 {pid}")
-                            except:
-                                pass
-                    
-                    import time
-                    time.sleep(1)
-                    print(f"  ✅ 端口 {port} 已释放")
-                    return True
-                except Exception as e:
-                    print(f"  ❌ 无法自动释放端口: {e}")
-                    return False
-        else:
+        if not port_in_use(port):
             return True
+        
+        print(f"⚠️  端口 {port} 已被占用，尝试释放...")
+        
+        # 终止占用端口的进程
+        procs = []
+        for pid in find_port_pids(port):
+            if pid == os.getpid():
+                continue
+            try:
+                proc = psutil.Process(pid)
+                proc.terminate()
+                procs.append(proc)
+                print(f"  ✅ 已终止进程 {pid}")
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        
+        # 等待进程退出（最多1秒），然后重新绑定确认
+        psutil.wait_procs(procs, timeout=1)
+        if port_in_use(port):
+            print(f"  ❌ 无法自动释放端口 {port}")
+            return False
+        
+        print(f"  ✅ 端口 {port} 已释放")
+        return True
             
     except Exception as e:
         print(f"  ❌ 检查端口时出错: {e}")
         return True
 
+def save_upload(stream, path):
+    """分块把上传内容写入文件，同时计算SHA-256（作为结果缓存的键）"""
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            f.write(chunk)
+    return hasher.hexdigest()
+
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.before_request
+def reject_oversize_upload():
+    """根据 Content-Length 提前拒绝超大上传，不读取请求体"""
+    max_length = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length is not None and request.content_length > max_length:
+        return jsonify({'success': False, 'error': f'文件大小不能超过 {max_length // (1024 * 1024)}MB'}), 413
+
 @app.route('/')
 def index():
     """首页"""
@@ -132,110 +174,20 @@ def upload_file():
         
         # 保存上传的文件
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        temp_input = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{timestamp}_{filename}')
-        file.save(temp_input)
-        
-        dir_name = os.path.dirname(temp_input)
-        base_name = os.path.basename(temp_input)
-        
-        results = []
-        error_messages = []
-        
-        # 模式1: 原有格式化
-        if mode in ['original', 'both']:
-            print("\n" + "="*60)
-            print("开始原有格式化...")
-            print("="*60)
-            try:
-                success_original = format_document(temp_input)
-                if success_original:
-                    original_output = os.path.join(dir_name, f"done_{base_name}")
-                    
-                    # 检查文件是否存在
-                    if os.path.exists(original_output):
-                        # 读取并保存到新位置
-                        with open(original_output, 'rb') as f:
-                            output_data = f.read()
-                        
-                        final_output = os.path.join(app.config['UPLOAD_FOLDER'], f'done_{timestamp}_{filename}')
-                        with open(final_output, 'wb') as f:
-                            f.write(output_data)
-                        
-                        # 删除原输出文件
-                        os.remove(original_output)
-                        
-                        results.append({
-                            'type': 'original',
-                            'download_url': f'/download/{os.path.basename(final_output)}',
-                            'filename': f'done_{filename}'
-                        })
-                        print(f"✅ 原版格式化完成: {final_output}")
-                    else:
-                        error_messages.append("原版格式化: 输出文件未生成")
-                else:
-                    error_messages.append("原版格式化: 处理失败")
-            except Exception as e:
-                error_messages.append(f"原版格式化失败: {str(e)}")
-                print(f"❌ 原版格式化失败: {str(e)}")
-        
-        # 模式2: LLM增强格式化
-        if mode in ['llm', 'both']:
-            print("\n" + "="*60)
-            print("开始LLM增强格式化...")
-            print("="*60)
-            try:
-                success_llm = llm_format_document(temp_input)
-                if success_llm:
-                    llm_output = os.path.join(dir_name, f"llm_{base_name}")
-                    
-                    # 检查文件是否存在
-                    if os.path.exists(llm_output):
-                        # 读取并保存到新位置
-                        with open(llm_output, 'rb') as f:
-                            output_data = f.read()
-                        
-                        final_output = os.path.join(app.config['UPLOAD_FOLDER'], f'llm_{timestamp}_{filename}')
-                        with open(final_output, 'wb') as f:
-                            f.write(output_data)
-                        
-                        # 删除原输出文件
-                        os.remove(llm_output)
-                        
-                        results.append({
-                            'type': 'llm',
-                            'download_url': f'/download/{os.path.basename(final_output)}',
-                            'filename': f'llm_{filename}'
-                        })
-                        print(f"✅ LLM增强版完成: {final_output}")
-                    else:
-                        error_messages.append("LLM增强: 输出文件未生成")
-                else:
-                    error_messages.append("LLM增强: 处理失败")
-            except Exception as e:
-                error_messages.append(f"LLM增强失败: {str(e)}")
-                print(f"❌ LLM增强失败: {str(e)}")
-        
-        # 清理上传的临时文件
-        if os.path.exists(temp_input):
-            os.remove(temp_input)
-        
-        # 判断处理结果
-        if len(results) == 0:
-            # 完全失败
-            error_msg = "处理失败: " + "; ".join(error_messages)
-            return jsonify({'success': False, 'error': error_msg}), 500
-        elif len(error_messages) > 0:
-            # 部分失败（双模式时）
-            warning_msg = "部分成功: " + "; ".join(error_messages)
-            print(f"⚠️  {warning_msg}")
+        tag = uuid.uuid4().hex[:12]  # 随机标识，并发上传同名文件也不会冲突
+        temp_input = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{tag}_{filename}')
+        with contextlib.ExitStack() as cleanup:
+            # 保存或提交失败时删除已写入的临时文件
+            cleanup.callback(remove_file, temp_input)
+            content_key = save_upload(file.stream, temp_input)
+            
+            # 提交到后台任务队列，立即返回任务ID（前端轮询 /status/<task_id>）
+            task_id = submit_task(temp_input, mode, tag, filename, app.config['UPLOAD_FOLDER'], content_key)
+            
+            # 提交成功后临时文件由后台任务负责删除
+            cleanup.pop_all()
         
-        # 返回文件下载链接
-        return jsonify({
-            'success': True,
-            'files': results,
-            'warnings': error_messages if len(error_messages) > 0 else None
-        })
+        return jsonify({'success': True, 'task_id': task_id})
         
     except Exception as e:
         print(f"处理错误: {str(e)}")
@@ -243,40 +195,141 @@ def upload_file():
         traceback.print_exc()
         return jsonify({'success': False, 'error': f'服务器错误: {str(e)}'}), 500
 
+@app.route('/upload_stream', methods=['POST'])
+def upload_stream():
+    """处理原始二进制上传（跳过multipart解析，直接分块写入磁盘）
+
+    用法: curl --data-binary @file.docx -H 'X-Filename: file.docx' 'http://localhost:5000/upload_stream?mode=both'
+    中文文件名需先做URL编码
+    """
+    try:
+        # 文件名通过请求头传递
+        original_name = unquote(request.headers.get('X-Filename', ''))
+
+        # 检查文件名
+        if original_name == '':
+            return jsonify({'success': False, 'error': '缺少 X-Filename 请求头'}), 400
+
+        # 检查文件类型
+        if not allowed_file(original_name):
+            return jsonify({'success': False, 'error': '只支持 .docx 格式的文件'}), 400
+
+        # 获取处理模式（默认双模式）
+        mode = request.args.get('mode', 'both')
+
+        # 分块写入临时文件，内存占用只有一个块的大小
+        filename = secure_filename(original_name)
+        tag = uuid.uuid4().hex[:12]  # 随机标识，并发上传同名文件也不会冲突
+        temp_input = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{tag}_{filename}')
+        with contextlib.ExitStack() as cleanup:
+            # 保存或提交失败时删除已写入的临时文件
+            cleanup.callback(remove_file, temp_input)
+            content_key = save_upload(request.stream, temp_input)
+
+            # 提交到后台任务队列，立即返回任务ID（前端轮询 /status/<task_id>）
+            task_id = submit_task(temp_input, mode, tag, filename, app.config['UPLOAD_FOLDER'], content_key)
+
+            # 提交成功后临时文件由后台任务负责删除
+            cleanup.pop_all()
+
+        return jsonify({'success': True, 'task_id': task_id})
+
+    except Exception as e:
+        print(f"处理错误: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': f'服务器错误: {str(e)}'}), 500
+
+@app.route('/status/<task_id>')
+def task_status(task_id):
+    """查询格式化任务状态"""
+    state, result = get_task_status(task_id)
+    
+    if state is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    
+    if state in (SUCCESS, FAILURE):
+        return jsonify({'state': state, 'result': result})
+    
+    return jsonify({'state': state})
+
+@app.route('/healthz')
+def healthz():
+    """存活检查：进程能响应请求即可"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/ready')
+def ready():
+    """就绪检查：格式化引擎已预热且进程池正常时返回200，否则返回503"""
+    if check_ready():
+        return jsonify({'ready': True})
+    return jsonify({'ready': False}), 503
+
+class _RemoveOnCloseFile(io.FileIO):
+    """关闭时自动删除的文件（交给WSGI服务器的file_wrapper发送）"""
+    
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        remove_file(self.name)
+
+def _stream_and_remove(file_path):
+    """按块读取文件并逐块返回，结束后删除文件"""
+    try:
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+    finally:
+        remove_file(file_path)
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """下载处理后的文件"""
     try:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        file_path = os.path.join(upload_folder, filename)
         
-        if not os.path.exists(file_path):
+        # 只提供上传目录下直接存放的文件：目录、结果缓存目录（gongwen_cache）中的文件都不可下载
+        if os.path.dirname(os.path.abspath(file_path)) != upload_folder or not os.path.isfile(file_path):
             return jsonify({'success': False, 'error': '文件不存在'}), 404
         
-        # 发送文件并在发送后删除
-        response = send_file(
-            file_path,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        )
+        mimetype = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        headers = {
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Content-Length': str(os.path.getsize(file_path))
+        }
         
-        # 设置一个回调来删除文件（Flask会在发送后执行）
-        @response.call_on_close
-        def cleanup():
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                pass
+        # gunicorn/uwsgi 等服务器提供 wsgi.file_wrapper 时，交给服务器用 sendfile(2) 零拷贝发送
+        # （有Content-Length时才会走sendfile，文件在服务器关闭wrapper时删除）
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return Response(
+                file_wrapper(_RemoveOnCloseFile(file_path), SENDFILE_BLOCK_SIZE),
+                mimetype=mimetype,
+                headers=headers,
+                direct_passthrough=True
+            )
         
-        return response
+        # 开发服务器：分块流式发送文件，发送完毕（或客户端断开）后删除
+        return Response(
+            stream_with_context(_stream_and_remove(file_path)),
+            mimetype=mimetype,
+            headers=headers
+        )
         
     except Exception as e:
         print(f"下载错误: {str(e)}")
         return jsonify({'success': False, 'error': f'下载失败: {str(e)}'}), 500
 
+# 启动时创建进程池并预热格式化流程，避免第一个请求承担冷启动开销
+if start_workers():
+    print("✅ 格式化引擎预热完成")
+
 if __name__ == '__main__':
     PORT = 5000
+    # 仅开发环境开启调试模式（调试器会拖慢每个请求）
+    debug = os.getenv('FLASK_ENV') == 'development'
     
     print("\n" + "=" * 60)
     print("  📄 公文格式调整工具 - Web版")
@@ -285,13 +338,28 @@ if __name__ == '__main__':
     # 检查并清理端口
     print("\n🔍 检查端口...")
     if check_and_kill_port(PORT):
+        # 非开发环境且已安装 gunicorn 时改用 gunicorn 启动（Windows 不支持 gunicorn）
+        gunicorn_path = shutil.which('gunicorn')
+        if not debug and os.name != 'nt' and gunicorn_path:
+            print("\n🚀 使用 gunicorn 启动服务...")
+            print(f"🌐 请在浏览器中访问: http://localhost:{PORT}")
+            print("\n按 Ctrl+C 停止服务\n")
+            print("=" * 60 + "\n")
+            
+            # 当前进程即将被替换，先关闭本进程的格式化进程池
+            shutdown_workers()
+            base_dir = os.path.dirname(os.path.abspath(__file__))
+            os.environ['PORT'] = str(PORT)
+            os.execv(gunicorn_path, [gunicorn_path, '--chdir', base_dir,
+                                     '-c', os.path.join(base_dir, 'gunicorn.conf.py'), 'wsgi:app'])
+        
         print("\n✅ 服务启动成功！")
         print(f"🌐 请在浏览器中访问: http://localhost:{PORT}")
         print("\n按 Ctrl+C 停止服务\n")
         print("=" * 60 + "\n")
         
         try:
-            app.run(debug=True, host='0.0.0.0', port=PORT, use_reloader=False)
+            app.run(debug=debug, host='0.0.0.0', port=PORT, use_reloader=False, threaded=True)
         except KeyboardInterrupt:
             print("\n\n👋 服务已停止\n")
     else:
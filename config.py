@@ -4,12 +4,38 @@
 配置文件
 """
 
+import os
+
 # Ollama 配置
 OLLAMA_CONFIG = {
     "base_url": "http://localhost:11434",
     "model": "qwen2.5:7b",
     "temperature": 0.1,  # 低温度保证稳定性
-    "timeout": 120  # 超时时间（秒）
+    "timeout": 120,  # 超时时间（秒），最后一次调用使用
+    "request_timeout": 60,  # 前几次调用的超时时间（秒），超时后重新发送
+    "max_retries": 1,  # 超时后最多重新发送的次数
+    "chunk_lines": 40,  # 长文档按多少行切分为一段分别识别
+    "chunk_overlap": 5,  # 每段前面附带的上文行数（只作参考，不采用其识别结果）
+    "parallel_requests": 4,  # 同时发送的识别请求数（Ollama 需设置 OLLAMA_NUM_PARALLEL 才能并行推理）
+    "parallel_documents": 2,  # 批量处理时同时处理的文档数（与 parallel_requests 相乘不超过连接池大小8）
+    "connect_timeout": 3,  # 建立连接的超时时间（秒），Ollama未启动时尽快失败
+    "keep_alive": "30m",  # 模型在显存中的保留时间，避免每次调用重新加载模型
+    "warmup": True,  # 连接检查时预先加载模型
+    "num_ctx": 8192,  # 上下文窗口（Prompt + 文档内容 + 输出的JSON）
+    "num_predict": 4096  # 最大输出token数（上限，实际按文档长度估算）
+}
+
+# 段落模板缓存配置（LLM增强版）
+CACHE_CONFIG = {
+    "enabled": True,
+    "template_cache_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "template_cache.json"),
+    "min_hits": 3,  # 同一签名至少被LLM确认多少次才直接复用
+    "min_ratio": 0.95,  # 确认结果中同一类型所占的最低比例
+    "verify_ratio": 0.1,  # 缓存命中的段落仍按该比例交给LLM重新确认，纠正错误的缓存类型
+    "template_cache_max_entries": 5000,  # 段落模板缓存最多保留的签名数，超出时删除最久未用的
+    "result_cache_dir": os.path.join(os.path.expanduser("~"), ".gongwen_cache"),  # LLM识别结果缓存目录，设为None只在进程内缓存
+    "result_cache_size": 128,  # 进程内缓存的识别结果数
+    "result_cache_max_files": 500  # 磁盘上最多保留的识别结果文件数
 }
 
 # 处理模式
@@ -9,10 +9,14 @@
 import os
 import sys
 import re
+import copy
+from functools import lru_cache
 from docx import Document
 from docx.shared import Pt, RGBColor, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
+from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
+from docx.text.run import Run
 
 # 数字到中文的映射
 NUM_TO_CHINESE = {
@@ -22,6 +26,31 @@ NUM_TO_CHINESE = {
     16: '十六', 17: '十七', 18: '十八', 19: '十九', 20: '二十'
 }
 
+# 中文到数字的映射
+CHINESE_TO_NUM = {chinese: num for num, chinese in NUM_TO_CHINESE.items()}
+
+# 各级标题的编号前缀（str.startswith 可直接传入元组）
+_LEVEL1_PREFIXES = tuple(f'{NUM_TO_CHINESE[i]}、' for i in range(1, 21))  # 一、二、
+_LEVEL2_PREFIXES = tuple(f'（{NUM_TO_CHINESE[i]}）' for i in range(1, 21))  # （一）（二）
+_LEVEL3_DOT = tuple(f'{i}.' for i in range(1, 21))  # 1. 2.
+_LEVEL4_PREFIXES = tuple(f'({i})' for i in range(1, 21))  # (1) (2)
+_SHI_PREFIXES = tuple(f'{NUM_TO_CHINESE[i]}是' for i in range(1, 21))  # 一是、二是
+_TITLE_EXCLUDED_PREFIXES = _LEVEL1_PREFIXES + _LEVEL2_PREFIXES + _LEVEL3_DOT + _SHI_PREFIXES  # 不可能是主标题的开头
+
+# 关键词
+_TITLE_KEYWORDS = ('通知', '报告', '决定', '意见', '办法', '方案', '规定', '通报', '请示', '批复', '函', '纪要')
+_ATTACHMENT_TITLE_KEYWORDS = _TITLE_KEYWORDS + ('制度', '汇编', '计划', '总结')
+_TITLE_BODY_START = ('为', '根据', '按照', '依据', '经', '现', '特')  # 正文开头常用词
+_BODY_START = _TITLE_BODY_START + ('鉴于', '考虑')
+_H1_KEYWORDS = ('推进', '加强', '提升', '优化', '深化', '强化', '完善', '创新',
+                '建设', '落实', '实施', '开展', '坚持', '注重', '突出', '聚焦',
+                '治理', '管理', '服务', '保障', '发展', '改革')
+_RECIPIENT_KEYWORDS = ('局', '委', '厅', '部', '省', '市', '区', '县', '办', '中心', '公司', '管理', '各')
+_SIGNATURE_KEYWORDS = ('公司', '单位', '部门', '局', '委', '厅', '省', '市', '区', '县',
+                       '中心', '办', '集团', '有限', '科技', '技术', '企业')
+_LEADING_BLANKS = ' \t\u3000'  # 段落开头需要清除的空格、Tab和全角空格
+_TRAILING_PUNCTUATION = ('。', '；', '，', '.', ';', ',', '、')  # 标题末尾需要清除的标点
+
 # GB/T 9704-2012 标准格式规范
 FORMAT_SPECS = {
     'title': {  # 主标题
@@ -106,20 +135,98 @@ FORMAT_SPECS = {
     }
 }
 
+# 标题级别 → (段落样式, 日志前缀, 名称)，按级别直接查表分派
+_HEADING_DISPATCH = {
+    1: ('heading1', '  🔹 ', '一级标题'),
+    2: ('heading2', '    🔸 ', '二级标题'),
+    3: ('heading3', '      ▪️  ', '三级标题'),
+    4: ('heading4', '        • ', '四级标题'),
+}
+
+# 预编译的正则表达式（逐段落调用的判断函数共用）
+# 标题编号：中文数字一~二十、阿拉伯数字1~20
+_CN_NUM = r'(?:二十|十[一二三四五六七八九]?|[一二三四五六七八九])'
+_ARABIC_NUM = r'(?:20|1[0-9]|[1-9])'
+_HEADING_RE = re.compile(
+    rf'^(?:(?P<h1>{_CN_NUM}、)'  # 一级：一、
+    rf'|(?P<h2>（{_CN_NUM}）)'  # 二级：（一）
+    rf'|(?P<h3>{_ARABIC_NUM}[.、])'  # 三级：1. 或 1、
+    rf'|(?P<h4>\({_ARABIC_NUM}\)))'  # 四级：(1)
+)
+_HEADING_LEVELS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4}
+_HEADING_FIRSTCHARS = frozenset('一二三四五六七八九十（123456789(')  # 标题编号可能的首字符
+# 附件标记：单独一行的"附件"、"附件："、"附件1"、"附件一"（后面没有其他内容）
+_ATTACHMENT_MARKER_RE = re.compile(r'^附件(?:\d+|[一二三四五六七八九十]+)?[：:\s]*$')
+# 表格/图片说明：表/图/表格/图片 + 数字 + 冒号（表1：、图1：、表格1：、图片1：）
+_CAPTION_RE = re.compile(r'^(?:表格?|图片?)\d+[：:]')
+_TABLE_FIGURE_PREFIX = re.compile(r'^[表图]\d+[：:]')
+# 日期格式（支持XX占位符），阿拉伯数字和中文数字两种写法合并为一个正则
+_DATE_RE = re.compile(
+    r'\d{4}年\d{1,2}月(?:\d{1,2}|XX)日'
+    r'|[二〇○零一二三四五六七八九十]{4,6}年[一二三四五六七八九十]+月(?:[一二三四五六七八九十]+|XX)日'
+)
+# 图片元素（DrawingML）
+_GRAPHIC_TAG = qn('a:graphic')
+_PIC_TAG = qn('pic:pic')
+_TC_TAG = qn('w:tc')  # 表格单元格
+# 拖拽文件时终端加的反斜杠转义（如：测试\ 文件.docx、\(、\[、\&）
+_PATH_ESCAPE_RE = re.compile(r'\\([ ()\[\]&])')
+# 关键词：各组关键词合并为一个正则，一次扫描判断是否包含任意关键词
+_TITLE_KEYWORD_RE = re.compile('|'.join(map(re.escape, _TITLE_KEYWORDS)))  # 主标题文种词
+_RECIPIENT_RE = re.compile('|'.join(map(re.escape, _RECIPIENT_KEYWORDS)))  # 主送机关
+_SIGNATURE_RE = re.compile('|'.join(map(re.escape, _SIGNATURE_KEYWORDS)))  # 署名中的单位
+_ATTACHMENT_TITLE_RE = re.compile('|'.join(map(re.escape, _ATTACHMENT_TITLE_KEYWORDS)))  # 附件标题文种词
+# "一是"~"二十是"：长的数字优先，"十一是"不会再被重复识别出其中的"一是"
+_SHI_RE = re.compile(rf'{_CN_NUM}是')
+# 附件列表
+_ATTACH_NUM_PREFIX = re.compile(r'^附件\d*[：:.]')  # 附件：、附件1：
+_ATTACH_LIST_START = re.compile(r'^附件[：:]\s*\d+[、，.]')  # 附件：1、XX
+_ATTACH_LIST_FIRST = re.compile(r'^附件[：:]\s*(\d+)[、，.](.+)$')
+_ATTACH_LIST_NEXT = re.compile(r'^(\d+)[、，.](.+)$')
+_ATTACH_LIST_FIRST_NORMALIZED = re.compile(r'^附件[：:]\d+\.')  # 规范化后的第一行：附件：1.XX
+_ATTACH_LIST_ITEM = re.compile(r'^\s{6}\d+\.')  # 规范化后的后续行：6个空格+数字+点
+_LEGACY_LIST_ITEM = re.compile(r'^\s*\d+[、，]')
+# 标题编号
+_LEVEL3_NUMBER = re.compile(r'^(\d+)\.')
+_LEVEL4_NUMBER = re.compile(r'^\((\d+)\)')
+# 修正标题编号时移除开头所有编号（可能有多重编号，如"（一）1、"），一次替换全部移除
+_LEADING_NUMBERING_RE = re.compile(
+    r'^(?:(?:[一二三四五六七八九十]{1,2}、'  # 一级：X、（中文数字+顿号）
+    r'|（[一二三四五六七八九十]{1,2}）'  # 二级：（X）（括号+中文数字+括号）
+    r'|\d+[.、]'  # 三级：X. 或 X、（数字+点/顿号）
+    r'|\(\d+\)\.?'  # 四级：(X) 或 (X).（半角括号+数字+半角括号，可带点）
+    r'|（\d+）'  # 四级变体：（X）（全角括号+数字+全角括号）
+    r'|[.．]'  # 多余的半角点、全角点
+    r')\s*)+'
+)
+# 格式化段落时清理编号后的多余内容（替换为 \1 保留编号本身）
+_MULTI_NUM_RE = re.compile(rf'^(（{_CN_NUM}）)(?:\d+[、.]|\.)+')  # 二级后的多重编号：（一）1、 （二）. （三）1.2、
+_CLEAN_L1_RE = re.compile(rf'^({_CN_NUM}、)\s+')  # 一、后的空格
+_CLEAN_L2_RE = re.compile(rf'^(（{_CN_NUM}）)、?\.?\s*。?')  # （一）后的顿号、点号、空格、句号
+_CLEAN_L3_RE = re.compile(rf'^({_ARABIC_NUM})[、.]\s*')  # 1、→1.，并清除点后的空格（替换为 \1.）
+_CLEAN_L4_RE = re.compile(rf'^(\({_ARABIC_NUM}\))、?\.?\s*。?')  # (1)后的顿号、点号、空格、句号
+
+# 附件列表段落格式用到的属性名（左对齐、首行缩进2字符、28磅固定行距，仿宋_GB2312 16磅不加粗黑色）
+# 只在导入时构造一次，格式化时直接设置到段落已有的元素上
+_W_VAL = qn('w:val')
+_W_LEFT = qn('w:left')
+_W_FIRST_LINE = qn('w:firstLine')
+_W_HANGING = qn('w:hanging')
+_W_LINE = qn('w:line')
+_W_LINE_RULE = qn('w:lineRule')
+_W_ASCII = qn('w:ascii')
+_W_H_ANSI = qn('w:hAnsi')
+_W_EAST_ASIA = qn('w:eastAsia')
+_ATTACH_LIST_FONT = '仿宋_GB2312'
+
 def is_title(paragraph, paragraph_count):
     """判断是否是主标题"""
     text = paragraph.text.strip()
     if not text:
         return False
     
-    # 生成所有可能的序号前缀
-    heading_prefixes = []
-    heading_prefixes.extend([f'{NUM_TO_CHINESE[i]}、' for i in range(1, 21)])
-    heading_prefixes.extend([f'（{NUM_TO_CHINESE[i]}）' for i in range(1, 21)])
-    heading_prefixes.extend([f'{i}.' for i in range(1, 21)])
-    heading_prefixes.extend([f'{NUM_TO_CHINESE[i]}是' for i in range(1, 21)])
-    
-    if any(text.startswith(prefix) for prefix in heading_prefixes):
+    # 排除以序号开头的段落
+    if text.startswith(_TITLE_EXCLUDED_PREFIXES):
         return False
     
     # 排除主送机关（以全角冒号结尾）
@@ -127,8 +234,7 @@ def is_title(paragraph, paragraph_count):
         return False
     
     # ⭐排除正文开头常用词
-    body_start_keywords = ['为', '根据', '按照', '依据', '经', '现', '特']
-    if any(text.startswith(kw) for kw in body_start_keywords):
+    if text.startswith(_TITLE_BODY_START):
         return False
     
     # ⭐排除附件标记
@@ -138,8 +244,7 @@ def is_title(paragraph, paragraph_count):
     # 标题通常是前几段，且包含关键词
     if paragraph_count <= 3:
         # 标题通常包含文种词
-        title_keywords = ['通知', '报告', '决定', '意见', '办法', '方案', '规定', '通报', '请示', '批复', '函', '纪要']
-        if any(kw in text for kw in title_keywords):
+        if _TITLE_KEYWORD_RE.search(text):
             return True
     
     return False
@@ -154,46 +259,29 @@ def is_recipient(text):
         if text.startswith('附件') and len(text) > 3:
             return False
         # 包含机关关键词或"各"字
-        keywords = ['局', '委', '厅', '部', '省', '市', '区', '县', '办', '中心', '公司', '管理', '各']
-        if any(kw in text for kw in keywords):
+        if _RECIPIENT_RE.search(text):
             return True
     return False
 
+@lru_cache(maxsize=4096)  # 只依赖文本，同一文本在验证、格式化等多轮处理中重复判断
 def get_heading_level(text):
-    """判断段落的标题级别"""
-    if not text:
-        return None
+    """判断段落的标题级别
     
-    # 一级标题：一、二、三、（必须是顿号，不是其他标点）
-    level1_prefixes = [f'{NUM_TO_CHINESE[i]}、' for i in range(1, 21)]
-    if any(text.startswith(prefix) for prefix in level1_prefixes):
-        return 1
-    
-    # 二级标题：（一）（二）（必须是括号，后面不能有标点）
-    # ⭐也支持"（一）、"等错误格式（会在apply_paragraph_format中修正）
-    level2_prefixes = [f'（{NUM_TO_CHINESE[i]}）' for i in range(1, 21)]
-    for prefix in level2_prefixes:
-        if text.startswith(prefix):
-            return 2
-    # 检查错误格式：（一）、、（一）。等
-    for i in range(1, 21):
-        if text.startswith(f'（{NUM_TO_CHINESE[i]}）、') or text.startswith(f'（{NUM_TO_CHINESE[i]}）。'):
-            return 2
-    
-    # 三级标题：1. 2. 3.（必须是半角点，不是顿号）
-    # ⭐也支持"1、"格式（错误格式，会在apply_paragraph_format中修正为"1."）
-    for i in range(1, 21):
-        if text.startswith(f'{i}.') or text.startswith(f'{i}、'):
-            return 3
-    
-    # 四级标题：(1) (2) (3)（半角括号）
-    # ⭐也支持"(1)、" "(1)." "(1)。"等错误格式（会在apply_paragraph_format中修正）
-    for i in range(1, 21):
-        if text.startswith(f'({i})') or text.startswith(f'({i})、') or text.startswith(f'({i}).') or text.startswith(f'({i})。'):
-            return 4
+    一级：一、二、三、（必须是顿号，不是其他标点）
+    二级：（一）（二）（必须是括号；"（一）、" "（一）。"等错误格式前缀相同，会在apply_paragraph_format中修正）
+    三级：1. 2. 3.（半角点；也支持"1、"错误格式，会在apply_paragraph_format中修正为"1."）
+    四级：(1) (2) (3)（半角括号；"(1)、" "(1)." "(1)。"等错误格式会在apply_paragraph_format中修正）
+    """
+    # 首字符不可能是编号时直接返回（绝大多数正文段落）
+    if not text or text[0] not in _HEADING_FIRSTCHARS:
+        return None
     
-    return None
+    match = _HEADING_RE.match(text)
+    if match is None:
+        return None
+    return _HEADING_LEVELS[match.lastgroup]
 
+@lru_cache(maxsize=4096)
 def detect_heading_after_numbering_removed(text):
     """检测移除自动编号后可能的标题（用于举一反三）
     移除自动编号后，原本的一级标题可能变成普通文字，需要通过内容推断
@@ -207,26 +295,23 @@ def detect_heading_after_numbering_removed(text):
         return level
     
     # ⭐排除正文特征：以常见正文起始词开头
-    body_start = ['为', '根据', '按照', '依据', '经', '现', '特', '鉴于', '考虑']
-    if any(text.startswith(w) for w in body_start):
+    if text.startswith(_BODY_START):
         return None
     
     # ⭐排除附件标记和附件列表项
     # 附件：、附件：1.、      2.（6空格开头）等
-    import re
-    if re.match(r'^附件\d*[：:.]', text):
+    if text.startswith('附件') and _ATTACH_NUM_PREFIX.match(text):
         return None
     # 排除6个空格开头+数字+点的附件列表项
-    if re.match(r'^\s{6}\d+\.', text):
+    if text[:1].isspace() and _ATTACH_LIST_ITEM.match(text):
         return None
     
     # ⭐排除以冒号结尾的（正文说明性文字）
-    if text.endswith('：') or text.endswith(':'):
+    if text.endswith(('：', ':')):
         return None
     
     # ⭐排除表格和图片说明（以"表"或"图"开头且包含序号和冒号）
-    import re
-    if re.match(r'^[表图]\d+[：:]', text):
+    if text.startswith(('表', '图')) and _TABLE_FIGURE_PREFIX.match(text):
         return None
     
     # 检查是否像一级标题的特征：
@@ -235,11 +320,7 @@ def detect_heading_after_numbering_removed(text):
     # 3. 包含关键动词或主题词
     if 6 <= len(text) <= 20 and not text.endswith('。'):
         # 一级标题常见关键词
-        h1_keywords = ['推进', '加强', '提升', '优化', '深化', '强化', '完善', '创新', 
-                       '建设', '落实', '实施', '开展', '坚持', '注重', '突出', '聚焦',
-                       '治理', '管理', '服务', '保障', '发展', '改革']
-        
-        if any(kw in text for kw in h1_keywords):
+        if any(kw in text for kw in _H1_KEYWORDS):
             return 1
     
     return None
@@ -253,18 +334,7 @@ def is_attachment_marker(text):
     # 1. 包含"附件"关键词
     # 2. 可能带序号：附件1、附件一、附件：、附件 1：等
     # 3. 通常是单独一行，不会有其他内容
-    
-    attachment_patterns = [
-        r'^附件[：:\s]*$',  # 单独的"附件"或"附件："
-        r'^附件\d+[：:\s]*$',  # 附件1、附件2（后面没有其他内容）
-        r'^附件[一二三四五六七八九十]+[：:\s]*$',  # 附件一、附件二（后面没有其他内容）
-    ]
-    
-    for pattern in attachment_patterns:
-        if re.search(pattern, text):
-            return True
-    
-    return False
+    return text.startswith('附件') and _ATTACHMENT_MARKER_RE.match(text) is not None
 
 def is_table_or_figure_caption(text):
     """判断是否是表格或图片说明
@@ -273,79 +343,86 @@ def is_table_or_figure_caption(text):
     if not text:
         return False
     
-    import re
     # 匹配：表/图/表格/图片 + 数字 + 冒号
-    patterns = [
-        r'^表\d+[：:]',      # 表1：、表2：
-        r'^图\d+[：:]',      # 图1：、图2：
-        r'^表格\d+[：:]',    # 表格1：
-        r'^图片\d+[：:]',    # 图片1：
-    ]
-    
-    for pattern in patterns:
-        if re.match(pattern, text):
-            return True
+    return text.startswith(('表', '图')) and _CAPTION_RE.match(text) is not None
+
+class PipelineCache:
+    """段落信息缓存：格式化流程开始时一次性读取每个段落的文本和标题级别
     
-    return False
+    后续各轮处理按段落下标读取，不再重复从XML拼接文本；
+    修改段落文本后需调用 refresh 更新对应下标
+    """
+    
+    def __init__(self, paragraphs_list):
+        self.paragraphs = paragraphs_list
+        self.raw_texts = [paragraph.text for paragraph in paragraphs_list]  # 原始文本（保留前导空格）
+        self.texts = [raw_text.strip() for raw_text in self.raw_texts]
+        self.heading_levels = [get_heading_level(text) for text in self.texts]
+    
+    def refresh(self, index):
+        """段落文本被修改后，重新读取该段落"""
+        raw_text = self.paragraphs[index].text
+        text = raw_text.strip()
+        self.raw_texts[index] = raw_text
+        self.texts[index] = text
+        self.heading_levels[index] = get_heading_level(text)
 
-def is_signature_or_date(paragraphs_list, current_index):
-    """判断是否是发文机关署名或成文日期（增强版）"""
+def is_signature_or_date(paragraphs_list, current_index, texts=None):
+    """判断是否是发文机关署名或成文日期（增强版）
+    
+    texts 为各段落去除首尾空白后的文本（PipelineCache.texts），未传入时从段落读取
+    """
     total = len(paragraphs_list)
     
     # 扩大检测范围：最后10个段落都可能是署名/日期
     if current_index < total - 10:
         return None
     
-    text = paragraphs_list[current_index].text.strip()
+    if texts is None:
+        texts = [paragraph.text.strip() for paragraph in paragraphs_list]
+    
+    text = texts[current_index]
     if not text:
         return None
     
     # 判断日期格式（更宽松，支持XX占位符）
-    date_patterns = [
-        r'\d{4}年\d{1,2}月\d{1,2}日',
-        r'\d{4}年\d{1,2}月XX日',  # 支持XX占位符
-        r'[二〇○零一二三四五六七八九十]{4,6}年[一二三四五六七八九十]+月[一二三四五六七八九十]+日',
-        r'[二〇○零一二三四五六七八九十]{4,6}年[一二三四五六七八九十]+月XX日',  # 支持XX占位符
-    ]
+    if _DATE_RE.search(text):
+        return 'date'
     
-    for pattern in date_patterns:
-        if re.search(pattern, text):
-            return 'date'
-    
-    # 判断署名（更精确）
-    signature_keywords = ['公司', '单位', '部门', '局', '委', '厅', '省', '市', '区', '县', 
-                         '中心', '办', '集团', '有限', '科技', '技术', '企业']
+    # 判断署名（更精确）：都要求当前行包含单位名称
+    if not _SIGNATURE_RE.search(text):
+        return None
     
     # 方法1：当前行包含单位名称，且下一行是日期
-    if any(kw in text for kw in signature_keywords):
-        # 查找后续几行中是否有日期
-        for j in range(1, min(3, total - current_index)):  # 检查后续2行
-            next_text = paragraphs_list[current_index + j].text.strip()
-            if next_text:  # 跳过空行
-                for pattern in date_patterns:
-                    if re.search(pattern, next_text):
-                        return 'signature'
-                break  # 只检查第一个非空行
+    # 查找后续几行中是否有日期
+    for j in range(1, min(3, total - current_index)):  # 检查后续2行
+        next_text = texts[current_index + j]
+        if next_text:  # 跳过空行
+            if _DATE_RE.search(next_text):
+                return 'signature'
+            break  # 只检查第一个非空行
     
     # 方法2：明确是倒数第二个有效段落（最后一个是日期）
-    if current_index == total - 2:
-        if any(kw in text for kw in signature_keywords):
-            last_text = paragraphs_list[-1].text.strip()
-            for pattern in date_patterns:
-                if re.search(pattern, last_text):
-                    return 'signature'
-    
-    # 方法3：倒数第三个段落，且倒数第二段是空行，最后一段是日期
-    if current_index == total - 3:
-        if any(kw in text for kw in signature_keywords):
-            # 检查倒数第二段是否为空（已在收集时被过滤）
-            last_text = paragraphs_list[-1].text.strip()
-            for pattern in date_patterns:
-                if re.search(pattern, last_text):
-                    return 'signature'
+    # 方法3：倒数第三个段落，且倒数第二段是空行（已在收集时被过滤），最后一段是日期
+    if current_index in (total - 2, total - 3):
+        if _DATE_RE.search(texts[-1]):
+            return 'signature'
     
     return None
 
+def collapse_runs(paragraph, text):
+    """保留第一个run的格式，删除其他runs，并将文本放入第一个run
+    
+    直接操作段落XML：先取出全部 w:r 元素，再逐个从段落中移除，不为每个run创建Run对象
+    """
+    p = paragraph._p
+    r_elements = p.r_lst
+    if not r_elements:
+        return
+    for r in r_elements[1:]:
+        p.remove(r)
+    Run(r_elements[0], paragraph).text = text
+
 def apply_paragraph_format(paragraph, style_name):
     """应用段落格式"""
     style = FORMAT_SPECS[style_name]
@@ -377,23 +454,32 @@ def apply_paragraph_format(paragraph, style_name):
     # ⭐⭐⭐ 清除段落开头的所有空格和Tab（彻底删除）
     # 1. 删除段落开头所有只包含空格/Tab的runs
     # 2. 清理第一个有效run开头的空格/Tab
-    while len(paragraph.runs) > 0:
-        first_run = paragraph.runs[0]
-        # 如果第一个run只包含空格/Tab，直接删除这个run
-        if first_run.text and first_run.text.strip() == '':
-            # 删除这个只有空格的run
-            first_run._element.getparent().remove(first_run._element)
+    # runs列表只取一次，按顺序处理，不在每次删除后重新查询
+    runs = paragraph.runs
+    start = 0
+    for first_run in runs:
+        run_text = first_run.text
+        # 如果第一个run只包含空格/Tab，记下后统一删除
+        if run_text and run_text.strip() == '':
+            start += 1
         else:
-            # 第一个run有实际内容，清理开头的空格/Tab
-            if first_run.text:
-                # 同时清理所有空格、Tab和全角空格
-                first_run.text = first_run.text.lstrip(' \t\u3000')
             break
+    # 删除这些只有空格的run
+    p = paragraph._p
+    for blank_run in runs[:start]:
+        p.remove(blank_run._r)
     
     # ⭐⭐ 清除所有runs中的Tab字符（标题中可能有自动编号的Tab）
-    for run in paragraph.runs:
-        if run.text and '\t' in run.text:
-            run.text = run.text.replace('\t', '')
+    # 每个run的文本只读取一次；第一个有效run同时清理开头的空格、Tab和全角空格
+    for i in range(start, len(runs)):
+        run = runs[i]
+        run_text = run.text
+        if not run_text:
+            continue
+        if i == start:
+            run.text = run_text.lstrip(_LEADING_BLANKS).replace('\t', '')
+        elif '\t' in run_text:
+            run.text = run_text.replace('\t', '')
     
     # ⭐⭐⭐ 清除标题序号后面的所有空格 + 错误标点 + 多重编号
     # 公文格式规范：
@@ -403,140 +489,56 @@ def apply_paragraph_format(paragraph, style_name):
     # - 四级标题：(1)（半角括号后不加空格，不加任何标点）
     
     # 关键：将所有runs合并处理，然后重新分配（因为Word可能将序号和内容分成不同runs）
+    full_text = None  # 合并后的文本，后续清理标点时复用，不再重新拼接
     if len(paragraph.runs) > 0:
-        import re
-        
         # 1. 合并所有runs的文本
         full_text = ''.join([run.text for run in paragraph.runs if run.text])
         original_full_text = full_text
         
         # ⭐⭐⭐ 0. 先清理多重编号（如"（一）1、"、"（二）."等）
-        # 使用循环清理机制，最多5次
-        for _ in range(5):
-            temp = full_text
-            
-            # 清理二级标题后的三级编号："（一）1、XX" → "（一）XX"、"（一）1.XX" → "（一）XX"
-            for i in range(1, 21):
-                chinese = ['一','二','三','四','五','六','七','八','九','十','十一','十二','十三','十四','十五','十六','十七','十八','十九','二十'][i-1]
-                full_text = re.sub(f'^（{chinese}）\\d+[、.]', f'（{chinese}）', full_text)
-            
-            # 清理二级标题后的单独点号："（二）.XX" → "（二）XX"
-            for i in range(1, 21):
-                chinese = ['一','二','三','四','五','六','七','八','九','十','十一','十二','十三','十四','十五','十六','十七','十八','十九','二十'][i-1]
-                full_text = re.sub(f'^（{chinese}）\\.', f'（{chinese}）', full_text)
-            
-            if full_text == temp:
-                break
+        # 一次匹配二级标题后连续的所有三级编号和单独点号："（一）1、XX" → "（一）XX"、"（二）.1.XX" → "（二）XX"
+        full_text = _MULTI_NUM_RE.sub(r'\1', full_text)
         
         # 2. 对合并后的文本进行清理
-        # 一级标题：清除"、"后的空格和错误标点
-        for i in range(1, 21):
-            # "一、  " → "一、"（清除空格）
-            pattern = f'^{NUM_TO_CHINESE[i]}、\\s+'
-            replacement = f'{NUM_TO_CHINESE[i]}、'
-            full_text = re.sub(pattern, replacement, full_text)
-        
-        # 二级标题：清除"）"后的空格和错误标点（尤其是顿号）
-        for i in range(1, 21):
-            # "（一）、" → "（一）"（清除顿号）
-            pattern = f'^（{NUM_TO_CHINESE[i]}）、'
-            replacement = f'（{NUM_TO_CHINESE[i]}）'
-            full_text = re.sub(pattern, replacement, full_text)
-            
-            # "（一）." → "（一）"（清除半角点）⭐⭐⭐ 新增
-            pattern = f'^（{NUM_TO_CHINESE[i]}）\\.'
-            replacement = f'（{NUM_TO_CHINESE[i]}）'
-            full_text = re.sub(pattern, replacement, full_text)
-            
-            # "（一）  " → "（一）"（清除空格）
-            pattern = f'^（{NUM_TO_CHINESE[i]}）\\s+'
-            replacement = f'（{NUM_TO_CHINESE[i]}）'
-            full_text = re.sub(pattern, replacement, full_text)
-            
-            # "（一）。" → "（一）"（清除句号）
-            pattern = f'^（{NUM_TO_CHINESE[i]}）。'
-            replacement = f'（{NUM_TO_CHINESE[i]}）'
-            full_text = re.sub(pattern, replacement, full_text)
-        
-        # 三级标题：清除点号后的空格，修正错误的顿号
-        for i in range(1, 21):
-            # "1、" → "1."（修正顿号为半角点）
-            pattern = f'^{i}、'
-            replacement = f'{i}.'
-            full_text = re.sub(pattern, replacement, full_text)
-            
-            # "1.  " → "1."（清除空格）
-            pattern = f'^{i}\\.\\s+'
-            replacement = f'{i}.'
-            full_text = re.sub(pattern, replacement, full_text)
-        
-        # 四级标题：清除括号后的空格和错误标点
-        for i in range(1, 21):
-            # "(1)、" → "(1)"（清除顿号）
-            pattern = f'^\\({i}\\)、'
-            replacement = f'({i})'
-            full_text = re.sub(pattern, replacement, full_text)
-            
-            # "(1)." → "(1)"（清除点号）
-            pattern = f'^\\({i}\\)\\.'
-            replacement = f'({i})'
-            full_text = re.sub(pattern, replacement, full_text)
-            
-            # "(1)  " → "(1)"（清除空格）
-            pattern = f'^\\({i}\\)\\s+'
-            replacement = f'({i})'
-            full_text = re.sub(pattern, replacement, full_text)
-            
-            # "(1)。" → "(1)"（清除句号）
-            pattern = f'^\\({i}\\)。'
-            replacement = f'({i})'
-            full_text = re.sub(pattern, replacement, full_text)
+        # 一级标题："一、  " → "一、"（清除空格）
+        full_text = _CLEAN_L1_RE.sub(r'\1', full_text)
+        
+        # 二级标题：清除"）"后的顿号、半角点、空格、句号，如"（一）、" → "（一）"
+        full_text = _CLEAN_L2_RE.sub(r'\1', full_text)
+        
+        # 三级标题："1、" → "1."（修正顿号为半角点），"1.  " → "1."（清除空格）
+        full_text = _CLEAN_L3_RE.sub(r'\1.', full_text)
+        
+        # 四级标题：清除括号后的顿号、点号、空格、句号，如"(1)、" → "(1)"
+        full_text = _CLEAN_L4_RE.sub(r'\1', full_text)
         
         # 3. 如果文本有变化，清空所有runs并用清理后的文本替换
         if full_text != original_full_text:
-            # 保留第一个run的格式，删除其他runs
-            while len(paragraph.runs) > 1:
-                paragraph.runs[-1]._element.getparent().remove(paragraph.runs[-1]._element)
-            
-            # 将清理后的文本放入第一个run
-            if len(paragraph.runs) > 0:
-                paragraph.runs[0].text = full_text
+            collapse_runs(paragraph, full_text)
     
     # ⭐⭐⭐ 清除标题末尾的标点符号（针对标题样式和title）
     if style_name in ['heading1', 'heading2', 'heading3', 'heading4', 'title']:
-        # 需要清除的标点
-        punctuation_to_remove = ['。', '；', '，', '.', ';', ',', '、']
-        
-        # 合并所有runs处理
-        if len(paragraph.runs) > 0:
-            full_text = ''.join([run.text for run in paragraph.runs if run.text])
+        # 合并所有runs处理（沿用上面清理编号后的文本）
+        if full_text is not None:
             original_full_text = full_text
             
-            # 清除末尾标点
-            for p in punctuation_to_remove:
-                if full_text.rstrip().endswith(p):
-                    full_text = full_text.rstrip()[:-1]
-                    break
+            # 清除末尾标点（标点都是单个字符，去掉末尾空白后删去最后一个字符）
+            stripped_text = full_text.rstrip()
+            if stripped_text.endswith(_TRAILING_PUNCTUATION):
+                full_text = stripped_text[:-1]
             
             # 如果有变化，更新文本
             if full_text != original_full_text:
-                # 保留第一个run的格式，删除其他runs
-                while len(paragraph.runs) > 1:
-                    paragraph.runs[-1]._element.getparent().remove(paragraph.runs[-1]._element)
-                
-                # 将清理后的文本放入第一个run
-                if len(paragraph.runs) > 0:
-                    paragraph.runs[0].text = full_text
+                collapse_runs(paragraph, full_text)
     
     # 检查"一是"、"二是"等 - 段落中任意位置
     text = paragraph.text
-    shi_prefixes = [f'{NUM_TO_CHINESE[i]}是' for i in range(1, 21)]
-    has_shi = any(prefix in text for prefix in shi_prefixes)
+    has_shi = _SHI_RE.search(text) is not None
     
     # 设置字体格式
     if has_shi:
         # 特殊处理：段落中包含"一是"、"二是"，只加粗这些词（不管是什么类型段落）
-        process_shi_paragraph(paragraph, style)
+        process_shi_paragraph(paragraph, style, text)
     else:
         # 常规格式
         for run in paragraph.runs:
@@ -548,30 +550,27 @@ def apply_paragraph_format(paragraph, style_name):
             # ⭐⭐⭐ 清除斜体
             run.font.italic = False
 
-def has_table(paragraph):
-    """判断段落是否在表格中"""
+def build_table_paragraph_set(doc):
+    """收集文档中所有位于表格单元格内的段落元素，供 has_table 查表"""
+    return {p for tc in doc.element.body.iter(_TC_TAG) for p in tc.iter(qn('w:p'))}
+
+def has_table(paragraph, table_paragraphs=None):
+    """判断段落是否在表格中
+    
+    table_paragraphs 为 build_table_paragraph_set 的结果，传入时直接查表，不再逐级查找父元素
+    """
     try:
-        # 检查段落的父元素是否是表格单元格
-        parent = paragraph._element.getparent()
-        while parent is not None:
-            if parent.tag.endswith('tc'):  # tc = table cell
-                return True
-            parent = parent.getparent()
-        return False
+        if table_paragraphs is not None:
+            return paragraph._element in table_paragraphs
+        # 检查段落的祖先元素中是否有表格单元格（tc = table cell）
+        return next(paragraph._element.iterancestors(_TC_TAG), None) is not None
     except:
         return False
 
 def has_image(paragraph):
-    """判断段落是否包含图片"""
+    """判断段落是否包含图片（a:graphic 或 pic:pic 元素），直接查找元素，不序列化XML"""
     try:
-        # 检查段落中是否有图片
-        for run in paragraph.runs:
-            if 'graphic' in run._element.xml or 'pic:pic' in run._element.xml:
-                return True
-        # 也检查段落的XML
-        if 'graphic' in paragraph._element.xml or 'pic:pic' in paragraph._element.xml:
-            return True
-        return False
+        return next(paragraph._element.iter(_GRAPHIC_TAG, _PIC_TAG), None) is not None
     except:
         return False
 
@@ -586,6 +585,37 @@ def center_image_paragraph(paragraph):
     except:
         pass
 
+def apply_attachment_list_format(paragraph):
+    """设置附件列表段落格式（和正文一样首行缩进2字符，仿宋16磅）
+    
+    不能用apply_paragraph_format，因为它会删除前导空格；
+    直接修改XML中对应的属性，效果与逐项设置 paragraph_format / run.font 相同，其余格式（斜体、下划线、段前段后等）保持不变
+    """
+    pPr = paragraph._p.get_or_add_pPr()
+    pPr.get_or_add_jc().set(_W_VAL, 'left')
+    
+    ind = pPr.get_or_add_ind()
+    ind.attrib.pop(_W_FIRST_LINE, None)
+    ind.attrib.pop(_W_HANGING, None)
+    ind.set(_W_FIRST_LINE, '640')  # 2字符缩进
+    ind.set(_W_LEFT, '0')
+    
+    spacing = pPr.get_or_add_spacing()
+    spacing.set(_W_LINE_RULE, 'exact')
+    spacing.set(_W_LINE, '560')  # 固定行距28磅
+    
+    for r in paragraph._p.r_lst:
+        rPr = r.get_or_add_rPr()
+        rFonts = rPr.get_or_add_rFonts()
+        rFonts.set(_W_ASCII, _ATTACH_LIST_FONT)
+        rFonts.set(_W_H_ANSI, _ATTACH_LIST_FONT)
+        rFonts.set(_W_EAST_ASIA, _ATTACH_LIST_FONT)
+        rPr.get_or_add_sz().set(_W_VAL, '32')
+        rPr.get_or_add_b().set(_W_VAL, '0')
+        # 颜色元素重建（去掉主题色等属性）
+        rPr._remove_color()
+        rPr.get_or_add_color().set(_W_VAL, '000000')
+
 def extract_numbering_info(paragraph):
     """提取段落的自动编号信息（级别和ID）"""
     try:
@@ -623,14 +653,14 @@ def infer_numbering_text(paragraphs_list, current_index):
         if current_level is None:
             return None
         
-        # 生成所有可能的同级别编号前缀
-        level_prefixes = []
+        # 所有可能的同级别编号前缀
+        level_prefixes = ()
         if current_level == 0:  # 一级：一、二、三、
-            level_prefixes = [f'{NUM_TO_CHINESE[i]}、' for i in range(1, 21)]
+            level_prefixes = _LEVEL1_PREFIXES
         elif current_level == 1:  # 二级：（一）（二）
-            level_prefixes = [f'（{NUM_TO_CHINESE[i]}）' for i in range(1, 21)]
+            level_prefixes = _LEVEL2_PREFIXES
         elif current_level == 2:  # 三级：1. 2. 3.
-            level_prefixes = [f'{i}.' for i in range(1, 21)]
+            level_prefixes = _LEVEL3_DOT
         
         # 统计当前段落之前有多少个同级别段落
         # 包括：1) 还有自动编号的段落  2) 已经处理过、文本开头有编号的段落
@@ -647,10 +677,8 @@ def infer_numbering_text(paragraphs_list, current_index):
                 continue
             
             # 方法2：检查文本开头是否有同级别编号（已处理过的段落）
-            for prefix in level_prefixes:
-                if text.startswith(prefix):
-                    same_level_count += 1
-                    break
+            if text.startswith(level_prefixes):
+                same_level_count += 1
         
         # 当前段落是第几个（从1开始）
         sequence_number = same_level_count + 1
@@ -672,6 +700,53 @@ def infer_numbering_text(paragraphs_list, current_index):
     except:
         return None
 
+def build_numbering_map(paragraphs_list):
+    """一次遍历推断所有自动编号段落应补回的编号文本，返回 {段落序号: 编号文本}
+    
+    结果与对每个段落调用 infer_numbering_text 相同：
+    序号 = 之前同级别同ID的自动编号段落数 + 之前文本以同级别编号开头的段落数（同一段落只计一次）+ 1
+    """
+    level_prefixes = {0: _LEVEL1_PREFIXES, 1: _LEVEL2_PREFIXES, 2: _LEVEL3_DOT}
+    same_id_counts = {}  # (级别, 编号ID) -> 自动编号段落数
+    prefix_counts = {level: 0 for level in level_prefixes}  # 级别 -> 文本以该级别编号开头的段落数
+    overlap_counts = {}  # (级别, 编号ID) -> 两者都满足的段落数（避免重复计数）
+    numbering_map = {}
+    
+    for i, paragraph in enumerate(paragraphs_list):
+        level, num_id = extract_numbering_info(paragraph)
+        key = (level, num_id)
+        
+        if level is not None:
+            sequence_number = (same_id_counts.get(key, 0) + prefix_counts.get(level, 0)
+                               - overlap_counts.get(key, 0) + 1)
+            
+            # 根据级别生成对应格式的编号文本
+            numbering_text = None
+            if level == 0:  # 一级标题：一、二、三、
+                if sequence_number in NUM_TO_CHINESE:
+                    numbering_text = f'{NUM_TO_CHINESE[sequence_number]}、'
+            elif level == 1:  # 二级标题：（一）（二）
+                if sequence_number in NUM_TO_CHINESE:
+                    numbering_text = f'（{NUM_TO_CHINESE[sequence_number]}）'
+            elif level == 2:  # 三级标题：1. 2. 3.
+                numbering_text = f'{sequence_number}.'
+            elif level == 3:  # 四级标题：(1) (2) (3)
+                numbering_text = f'({sequence_number})'
+            if numbering_text:
+                numbering_map[i] = numbering_text
+            
+            same_id_counts[key] = same_id_counts.get(key, 0) + 1
+        
+        # 统计文本开头的编号（供后续段落计数）
+        text = paragraph.text.strip()
+        for prefix_level, prefixes in level_prefixes.items():
+            if text.startswith(prefixes):
+                prefix_counts[prefix_level] += 1
+                if prefix_level == level:
+                    overlap_counts[key] = overlap_counts.get(key, 0) + 1
+    
+    return numbering_map
+
 def remove_numbering_smart(paragraphs_list, current_index):
     """智能移除段落的自动编号，并根据上下文推断编号补回"""
     try:
@@ -695,20 +770,9 @@ def remove_numbering_smart(paragraphs_list, current_index):
             current_text = paragraph.text.strip()
             
             # 检查是否已经有编号文本了
-            has_numbering = False
-            for i in range(1, 21):
-                if current_level == 0 and current_text.startswith(f'{NUM_TO_CHINESE[i]}、'):
-                    has_numbering = True
-                    break
-                elif current_level == 1 and current_text.startswith(f'（{NUM_TO_CHINESE[i]}）'):
-                    has_numbering = True
-                    break
-                elif current_level == 2 and current_text.startswith(f'{i}.'):
-                    has_numbering = True
-                    break
-                elif current_level == 3 and current_text.startswith(f'({i})'):
-                    has_numbering = True
-                    break
+            level_prefixes = {0: _LEVEL1_PREFIXES, 1: _LEVEL2_PREFIXES,
+                              2: _LEVEL3_DOT, 3: _LEVEL4_PREFIXES}.get(current_level, ())
+            has_numbering = current_text.startswith(level_prefixes)
             
             if not has_numbering:
                 # 在段落开头插入编号文本
@@ -726,70 +790,63 @@ def remove_numbering_smart(paragraphs_list, current_index):
     except Exception as e:
         return None
 
-def process_shi_paragraph(paragraph, style):
-    """处理"一是"、"二是"等段落，对所有"X是"加粗"""
-    text = paragraph.text
-    shi_prefixes = [f'{NUM_TO_CHINESE[i]}是' for i in range(1, 21)]
-    
-    # 查找所有"X是"的位置
-    shi_positions = []
-    for prefix in shi_prefixes:
-        pos = 0
-        while True:
-            pos = text.find(prefix, pos)
-            if pos == -1:
-                break
-            shi_positions.append((pos, prefix))
-            pos += len(prefix)
+def process_shi_paragraph(paragraph, style, text=None):
+    """处理"一是"、"二是"等段落，对所有"X是"加粗
+    
+    text 为段落当前文本（调用方已读取时传入，避免重复拼接）
+    """
+    if text is None:
+        text = paragraph.text
+    
+    # 查找所有"X是"的位置（一次扫描，结果按位置排列且互不重叠）
+    shi_positions = [(match.start(), match.group()) for match in _SHI_RE.finditer(text)]
     
     # 如果没找到任何"X是"，返回False
     if not shi_positions:
         return False
     
-    # 按位置排序
-    shi_positions.sort(key=lambda x: x[0])
-    
     # 清空段落并重建
     paragraph.clear()
+    rpr_templates = {}  # 是否加粗 -> 已设置好格式的rPr，后续同类run直接复制
     
     last_pos = 0
     for pos, prefix in shi_positions:
         # 添加"X是"前面的普通文本
         if pos > last_pos:
-            before_text = text[last_pos:pos]
-            before_run = paragraph.add_run(before_text)
-            before_run.font.name = style['font_name']
-            before_run._element.rPr.rFonts.set(qn('w:eastAsia'), style['font_name'])
-            before_run.font.size = style['font_size']
-            before_run.font.bold = False
-            before_run.font.color.rgb = RGBColor(0, 0, 0)
-            before_run.font.italic = False  # ⭐清除斜体
+            add_styled_run(paragraph, text[last_pos:pos], style, False, rpr_templates)
         
         # 添加加粗的"X是"
-        bold_run = paragraph.add_run(prefix)
-        bold_run.font.name = style['font_name']
-        bold_run._element.rPr.rFonts.set(qn('w:eastAsia'), style['font_name'])
-        bold_run.font.size = style['font_size']
-        bold_run.font.bold = True
-        bold_run.font.color.rgb = RGBColor(0, 0, 0)
-        bold_run.font.italic = False  # ⭐清除斜体
+        add_styled_run(paragraph, prefix, style, True, rpr_templates)
         
         last_pos = pos + len(prefix)
     
     # 添加最后剩余的文本
     if last_pos < len(text):
-        remaining = text[last_pos:]
-        remaining_run = paragraph.add_run(remaining)
-        remaining_run.font.name = style['font_name']
-        remaining_run._element.rPr.rFonts.set(qn('w:eastAsia'), style['font_name'])
-        remaining_run.font.size = style['font_size']
-        remaining_run.font.bold = False
-        remaining_run.font.color.rgb = RGBColor(0, 0, 0)
-        remaining_run.font.italic = False  # ⭐清除斜体
+        add_styled_run(paragraph, text[last_pos:], style, False, rpr_templates)
     
     return True
 
-def validate_and_fix_heading_structure(paragraphs_list):
+def add_styled_run(paragraph, text, style, bold, rpr_templates):
+    """在段落末尾添加一个run并设置字体格式（仿宋/黑体等、字号、黑色、不斜体）
+    
+    rpr_templates 缓存已设置好的rPr：同一段落中加粗与否相同的run只逐项设置一次，其余直接复制
+    """
+    run = paragraph.add_run(text)
+    template = rpr_templates.get(bold)
+    if template is not None:
+        run._r.insert(0, copy.deepcopy(template))
+        return run
+    
+    run.font.name = style['font_name']
+    run._element.rPr.rFonts.set(qn('w:eastAsia'), style['font_name'])
+    run.font.size = style['font_size']
+    run.font.bold = bold
+    run.font.color.rgb = RGBColor(0, 0, 0)
+    run.font.italic = False  # ⭐清除斜体
+    rpr_templates[bold] = run._r.rPr
+    return run
+
+def validate_and_fix_heading_structure(paragraphs_list, cache=None):
     """验证并修正标题层级结构
     
     规则：
@@ -797,13 +854,19 @@ def validate_and_fix_heading_structure(paragraphs_list):
     2. 层级合理性：一级标题下只能是二级标题，不能直接跳到三级或四级
     3. 子编号重置：每个一级标题下的二级标题必须从"（一）"开始，三级标题从"1."开始
     4. 附件独立编号：附件部分的标题编号从"一、"重新开始
+    
+    cache 为 PipelineCache，未传入时新建；修正过的标题会同步更新到缓存
     """
     print("  🔍 开始验证标题层级结构...")
     
+    # 每个段落的文本只读取一次
+    if cache is None:
+        cache = PipelineCache(paragraphs_list)
+    texts = cache.texts
+    
     # ⭐⭐⭐ 第一步：查找附件标记位置
     attachment_start_index = None
-    for i, paragraph in enumerate(paragraphs_list):
-        text = paragraph.text.strip()
+    for i, text in enumerate(texts):
         if is_attachment_marker(text):
             attachment_start_index = i
             print(f"  📎 检测到附件标记位置: 第{i+1}段，附件内容将独立编号")
@@ -813,8 +876,8 @@ def validate_and_fix_heading_structure(paragraphs_list):
     heading_info = []  # [(paragraph, level, current_number, index, is_in_attachment), ...]
     
     for i, paragraph in enumerate(paragraphs_list):
-        text = paragraph.text.strip()
-        level = get_heading_level(text)
+        text = texts[i]
+        level = cache.heading_levels[i]
         
         # ⭐⭐⭐ 关键：只有已经有明确编号的才算标题
         # 不使用detect_heading_after_numbering_removed，避免把文档标题误判为一级标题
@@ -839,7 +902,7 @@ def validate_and_fix_heading_structure(paragraphs_list):
     last_is_in_attachment = False  # 上一个标题是否在附件中
     
     for idx, (paragraph, level, current_num, para_idx, is_in_attachment) in enumerate(heading_info):
-        text = paragraph.text.strip()
+        text = texts[para_idx]
         original_level = level
         
         # ⭐⭐⭐ 关键：进入附件部分时，重置所有计数器
@@ -891,6 +954,7 @@ def validate_and_fix_heading_structure(paragraphs_list):
             
             # 执行修正
             fix_heading_number(paragraph, level, expected_num)
+            cache.refresh(para_idx)
             fixed_count += 1
         
         last_level = level
@@ -901,7 +965,7 @@ def validate_and_fix_heading_structure(paragraphs_list):
     else:
         print("  ✅ 标题层级结构正确\n")
 
-def normalize_attachment_list(paragraphs_list):
+def normalize_attachment_list(paragraphs_list, cache=None):
     """规范化附件列表格式
     
     规则：
@@ -909,17 +973,21 @@ def normalize_attachment_list(paragraphs_list):
     2. 后续行：      2.XXX（前面6个空格，和1.对齐）
     3. 编号连续性：1、2、3，不能跳号
     4. 格式：仿宋16磅，不加粗（正文格式）
-    """
-    import re
     
+    cache 为 PipelineCache，未传入时新建；改写过的段落会同步更新到缓存
+    """
     print("  🔍 开始规范化附件列表...")
     
+    # 每个段落的文本只读取一次
+    if cache is None:
+        cache = PipelineCache(paragraphs_list)
+    texts = cache.texts
+    
     # 查找附件列表起始位置
     attachment_list_start = -1
-    for i, para in enumerate(paragraphs_list):
-        text = para.text.strip()
+    for i, text in enumerate(texts):
         # 匹配"附件："或"附件:"开头的行
-        if re.match(r'^附件[：:]\s*\d+[、，.]', text):
+        if _ATTACH_LIST_START.match(text):
             attachment_list_start = i
             print(f"  📎 检测到附件列表起始: 第{i+1}段")
             break
@@ -933,24 +1001,24 @@ def normalize_attachment_list(paragraphs_list):
     current_index = attachment_list_start
     
     # 第一行：提取"附件：1、XXX"中的内容
-    first_text = paragraphs_list[current_index].text.strip()
-    match = re.match(r'^附件[：:]\s*(\d+)[、，.](.+)$', first_text)
+    first_text = texts[current_index]
+    match = _ATTACH_LIST_FIRST.match(first_text)
     if match:
         num = int(match.group(1))
         content = match.group(2).strip()
-        attachment_items.append((paragraphs_list[current_index], num, content, True))  # True表示是第一行
+        attachment_items.append((current_index, num, content, True))  # True表示是第一行
         current_index += 1
     
     # 后续行：匹配"2、XXX"或"  2、XXX"
     while current_index < len(paragraphs_list):
-        text = paragraphs_list[current_index].text.strip()
+        text = texts[current_index]
         
         # 匹配数字+顿号/逗号/点开头
-        match = re.match(r'^(\d+)[、，.](.+)$', text)
+        match = _ATTACH_LIST_NEXT.match(text)
         if match:
             num = int(match.group(1))
             content = match.group(2).strip()
-            attachment_items.append((paragraphs_list[current_index], num, content, False))  # False表示不是第一行
+            attachment_items.append((current_index, num, content, False))  # False表示不是第一行
             current_index += 1
         else:
             # 不再是附件列表项，退出
@@ -964,7 +1032,8 @@ def normalize_attachment_list(paragraphs_list):
     
     # 检查编号连续性并修正
     fixed_count = 0
-    for idx, (paragraph, current_num, content, is_first) in enumerate(attachment_items, 1):
+    for idx, (para_idx, current_num, content, is_first) in enumerate(attachment_items, 1):
+        paragraph = paragraphs_list[para_idx]
         expected_num = idx
         
         # ⭐⭐⭐ 格式规则：
@@ -976,29 +1045,25 @@ def normalize_attachment_list(paragraphs_list):
             new_text = f"      {expected_num}.{content}"  # 6个空格
         
         if current_num != expected_num:
-            print(f"    🔧 第{paragraphs_list.index(paragraph)+1}段: 编号{current_num}→{expected_num}")
+            print(f"    🔧 第{para_idx+1}段: 编号{current_num}→{expected_num}")
             fixed_count += 1
         
         # 更新段落文本
         # 保留第一个run，删除其他runs
-        while len(paragraph.runs) > 1:
-            paragraph.runs[-1]._element.getparent().remove(paragraph.runs[-1]._element)
-        
-        if len(paragraph.runs) > 0:
-            paragraph.runs[0].text = new_text
+        if paragraph.runs:
+            collapse_runs(paragraph, new_text)
         else:
             paragraph.add_run(new_text)
         
         # 清除加粗格式（确保是正文格式）
-        for run in paragraph.runs:
-            run.font.bold = False
+        # 此时段落只剩一个run，直接写它的 w:b，不再遍历 paragraph.runs
+        paragraph._p.r_lst[0].get_or_add_rPr().get_or_add_b().val = False
         
         # ⭐⭐⭐ 设置段落格式：左对齐，无缩进
-        from docx.enum.text import WD_ALIGN_PARAGRAPH
-        from docx.shared import Pt
         paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
         paragraph.paragraph_format.first_line_indent = Pt(0)
         paragraph.paragraph_format.left_indent = Pt(0)
+        cache.refresh(para_idx)
     
     if fixed_count > 0:
         print(f"  ✅ 共修正 {fixed_count} 个附件编号\n")
@@ -1008,29 +1073,28 @@ def normalize_attachment_list(paragraphs_list):
 
 def extract_current_number(text, level):
     """从标题文本中提取当前编号"""
-    import re
-    
     if level == 1:
-        # 一、二、三、
-        for i in range(1, 21):
-            if text.startswith(f'{NUM_TO_CHINESE[i]}、'):
-                return i
+        # 一、二、三、：取第一个顿号前的中文数字查表
+        chinese, sep, _ = text.partition('、')
+        if sep and chinese in CHINESE_TO_NUM:
+            return CHINESE_TO_NUM[chinese]
     
     elif level == 2:
-        # （一）（二）
-        for i in range(1, 21):
-            if text.startswith(f'（{NUM_TO_CHINESE[i]}）'):
-                return i
+        # （一）（二）：取括号内的中文数字查表
+        if text.startswith('（'):
+            chinese, sep, _ = text[1:].partition('）')
+            if sep and chinese in CHINESE_TO_NUM:
+                return CHINESE_TO_NUM[chinese]
     
     elif level == 3:
         # 1. 2. 3.
-        match = re.match(r'^(\d+)\.', text)
+        match = _LEVEL3_NUMBER.match(text)
         if match:
             return int(match.group(1))
     
     elif level == 4:
         # (1) (2) (3)
-        match = re.match(r'^\((\d+)\)', text)
+        match = _LEVEL4_NUMBER.match(text)
         if match:
             return int(match.group(1))
     
@@ -1050,48 +1114,15 @@ def get_number_display(num, level):
 
 def fix_heading_number(paragraph, level, correct_number):
     """修正标题编号（支持跨层级转换）"""
-    import re
-    
     if len(paragraph.runs) == 0:
         return
     
     # 合并所有runs的文本
     full_text = ''.join([run.text for run in paragraph.runs if run.text])
     
-    # ⭐⭐⭐ 关键改进：循环移除所有编号格式，直到没有任何编号为止
+    # ⭐⭐⭐ 关键改进：移除开头所有编号格式，直到没有任何编号为止
     # 这样可以处理"（一）1、"这种多重编号的情况
-    max_iterations = 5  # 最多循环5次，避免死循环
-    for _ in range(max_iterations):
-        original = full_text
-        
-        # 移除一级：X、（中文数字+顿号）
-        full_text = re.sub(r'^[一二三四五六七八九十]{1,2}、\s*', '', full_text)
-        
-        # 移除二级：（X）（括号+中文数字+括号）
-        full_text = re.sub(r'^（[一二三四五六七八九十]{1,2}）\s*', '', full_text)
-        
-        # 移除三级变体1：X.（数字+点）
-        full_text = re.sub(r'^\d+\.\s*', '', full_text)
-        
-        # 移除三级变体2：X、（数字+顿号）⭐⭐⭐ 这个之前漏了！
-        full_text = re.sub(r'^\d+、\s*', '', full_text)
-        
-        # 移除四级变体1：(X)（半角括号+数字+半角括号）
-        full_text = re.sub(r'^\(\d+\)\s*', '', full_text)
-        
-        # 移除四级变体2：(X).（半角括号+数字+半角括号+点）⭐⭐⭐ 这个之前也漏了！
-        full_text = re.sub(r'^\(\d+\)\.\s*', '', full_text)
-        
-        # 移除四级变体3：（X）（全角括号+数字+全角括号）
-        full_text = re.sub(r'^（\d+）\s*', '', full_text)
-        
-        # 移除可能的多余点和空格
-        full_text = re.sub(r'^\.\s*', '', full_text)
-        full_text = re.sub(r'^．\s*', '', full_text)  # 全角点
-        
-        # 如果没有变化，说明已经清理干净了
-        if full_text == original:
-            break
+    full_text = _LEADING_NUMBERING_RE.sub('', full_text)
     
     # 移除开头的多余空格
     full_text = full_text.lstrip()
@@ -1110,14 +1141,13 @@ def fix_heading_number(paragraph, level, correct_number):
     
     # 更新段落文本
     # 保留第一个run，删除其他runs
-    while len(paragraph.runs) > 1:
-        paragraph.runs[-1]._element.getparent().remove(paragraph.runs[-1]._element)
-    
-    if len(paragraph.runs) > 0:
-        paragraph.runs[0].text = new_text
+    collapse_runs(paragraph, new_text)
 
-def format_document(input_path):
-    """格式化公文文档（完整版）"""
+def format_document(input_path, output_path=None):
+    """格式化公文文档（完整版）
+    
+    output_path 为空时输出到输入文件同目录下的 done_<文件名>
+    """
     try:
         print(f"\n📄 正在处理: {os.path.basename(input_path)}")
         print("━" * 50)
@@ -1134,14 +1164,18 @@ def format_document(input_path):
         section.right_margin = Cm(2.6)
         print("  ✅ 页边距: 上3.7cm 下3.5cm 左2.8cm 右2.6cm")
         
+        # 段落列表只从XML读取一次，删除段落时同步更新列表
+        all_paragraphs = list(doc.paragraphs)
+        
         # ⭐ 新增：删除文档末尾的空行
         removed_trailing = 0
-        while len(doc.paragraphs) > 0:
-            last_para = doc.paragraphs[-1]
+        while all_paragraphs:
+            last_para = all_paragraphs[-1]
             if not last_para.text.strip() and not has_image(last_para):
                 # 删除最后一个空段落
                 p = last_para._element
                 p.getparent().remove(p)
+                all_paragraphs.pop()
                 removed_trailing += 1
             else:
                 break
@@ -1153,17 +1187,11 @@ def format_document(input_path):
         if table_count > 0:
             print(f"  📊 检测到 {table_count} 个表格（将跳过不处理）")
         
-        # 3. 收集所有段落（包括空段落，用于智能推断编号）
-        all_paragraphs = list(doc.paragraphs)
+        # 3. 所有段落（包括空段落，用于智能推断编号）即 all_paragraphs
         
         # 4. 第一遍：智能推断所有编号（在移除之前）
         print("  🔧 智能推断编号文本...")
-        numbering_map = {}  # 存储每个段落应该补回的编号文本
-        
-        for i in range(len(all_paragraphs)):
-            numbering_text = infer_numbering_text(all_paragraphs, i)
-            if numbering_text:
-                numbering_map[i] = numbering_text
+        numbering_map = build_numbering_map(all_paragraphs)  # 存储每个段落应该补回的编号文本
         
         print(f"  ✅ 推断出 {len(numbering_map)} 个编号")
         
@@ -1171,19 +1199,23 @@ def format_document(input_path):
         print("  🔧 移除自动编号并补回...")
         numbering_补回_count = 0
         
-        for i, paragraph in enumerate(all_paragraphs):
-            # 检查是否有编号格式
-            pPr = paragraph._element.pPr
-            has_numbering = False
-            if pPr is not None:
-                numPr = pPr.find(qn('w:numPr'))
-                if numPr is not None:
-                    has_numbering = True
-                    # 移除编号格式
-                    pPr.remove(numPr)
+        # 一次遍历正文XML找出所有编号元素（numPr），只处理正文段落自身的编号（表格中的段落不在 all_paragraphs 中）
+        # 先收集再移除，不在遍历XML的同时修改
+        paragraph_index = {paragraph._element: i for i, paragraph in enumerate(all_paragraphs)}
+        numbered_paragraphs = []  # [(段落序号, pPr, numPr), ...]
+        for numPr in doc.element.body.iter(qn('w:numPr')):
+            pPr = numPr.getparent()
+            i = paragraph_index.get(pPr.getparent())
+            if i is not None:
+                numbered_paragraphs.append((i, pPr, numPr))
+        
+        for i, pPr, numPr in numbered_paragraphs:
+            # 移除编号格式
+            pPr.remove(numPr)
             
-            # 如果有编号格式，且推断出了编号文本，则补回
-            if has_numbering and i in numbering_map:
+            # 如果推断出了编号文本，则补回
+            if i in numbering_map:
+                paragraph = all_paragraphs[i]
                 numbering_text = numbering_map[i]
                 current_text = paragraph.text.strip()
                 
@@ -1202,176 +1234,99 @@ def format_document(input_path):
         if numbering_补回_count > 0:
             print(f"  ✅ 共补回 {numbering_补回_count} 个编号")
         
-        # 6. 删除标题上方的空行（可能有多个连续空行，需要多次扫描）
+        # 6. 删除标题上方的空行（可能有多个连续空行）
+        # 一次顺序扫描：记录连续的空段落，遇到标题时把它上方这些空段落全部删除
+        # 同时收集非空段落（有文字或图片）用于格式化，不再重新读取文本、检查图片
         print("  🧹 检查并删除标题上方的空行...")
         removed_empty = 0
+        paragraphs_list = []
+        pending_empty = []  # 紧挨在当前位置之前的连续空段落（不含图片）
         
-        # 多次扫描，直到没有可删除的空行
-        while True:
-            deleted_in_this_round = 0
-            i = 1  # 从第二段开始检查
+        for curr_para in all_paragraphs:
+            curr_text = curr_para.text.strip()
             
-            while i < len(doc.paragraphs):
-                prev_para = doc.paragraphs[i - 1]
-                curr_para = doc.paragraphs[i]
-                
-                prev_text = prev_para.text.strip()
-                curr_text = curr_para.text.strip()
-                
-                # ⭐检查当前段落是否是标题（包括标准格式和智能推断）
+            if not curr_text and not has_image(curr_para):
+                pending_empty.append(curr_para)
+                continue
+            
+            # ⭐检查当前段落是否是标题（包括标准格式和智能推断）
+            is_heading = False
+            if curr_text:
                 is_heading = get_heading_level(curr_text) is not None
                 if not is_heading:
                     # 也检查智能推断的标题
                     is_heading = detect_heading_after_numbering_removed(curr_text) is not None
-                
-                # 如果当前是标题，且上一段为空，删除上一段
-                if is_heading and not prev_text and not has_image(prev_para):
-                    p = prev_para._element
-                    p.getparent().remove(p)
-                    removed_empty += 1
-                    deleted_in_this_round += 1
-                    # 删除后重新开始循环
-                    break
-                
-                i += 1
             
-            # 如果这一轮没有删除任何空行，退出
-            if deleted_in_this_round == 0:
-                break
+            # 如果当前是标题，删除上方的空段落
+            if is_heading:
+                for empty_para in pending_empty:
+                    p = empty_para._element
+                    p.getparent().remove(p)
+                removed_empty += len(pending_empty)
+            pending_empty = []
+            paragraphs_list.append(curr_para)
         
         if removed_empty > 0:
             print(f"  ✓ 删除标题上方空行: {removed_empty} 个")
         
-        # 5. 收集所有非空段落用于格式化
-        paragraphs_list = [p for p in doc.paragraphs if p.text.strip() or has_image(p)]
+        # 5. 非空段落已在上面的扫描中收集
         total = len(paragraphs_list)
         print(f"  📝 共 {total} 个有效段落")
         
+        # 一次性读取各段落文本，后续各轮处理共用
+        cache = PipelineCache(paragraphs_list)
+        
         # ⭐⭐⭐ 新增：验证并修正标题层级结构
-        validate_and_fix_heading_structure(paragraphs_list)
+        validate_and_fix_heading_structure(paragraphs_list, cache)
         
         # ⭐⭐⭐ 新增：规范化附件列表格式
-        normalize_attachment_list(paragraphs_list)
+        normalize_attachment_list(paragraphs_list, cache)
         
         # 5. 检测附件位置
         attachment_start_index = None
-        for i, paragraph in enumerate(paragraphs_list):
-            text = paragraph.text.strip()
+        for i, text in enumerate(cache.texts):
             if is_attachment_marker(text):
                 attachment_start_index = i
                 print(f"  📎 检测到附件标记: {text}（第{i+1}个段落）")
                 break
         
         # 6. 处理每个段落
+        table_paragraphs = build_table_paragraph_set(doc)
         title_found = False
         recipient_found = False
         paragraph_count = 0
         skipped_table = 0
         processed_image = 0
-        in_attachment = False  # 是否进入附件部分
         attachment_title_found = False  # 附件中是否找到标题
         in_attachment_list = False  # 是否在附件列表中（"附件：1、XX  2、XX"）
         
-        for paragraph in paragraphs_list:
-            text = paragraph.text.strip()
-            paragraph_count += 1
-            current_index = paragraphs_list.index(paragraph)
-            
-            # 检查是否进入附件部分
-            if attachment_start_index is not None and current_index >= attachment_start_index:
-                if not in_attachment:
-                    in_attachment = True
-                    print(f"\n  📎 === 开始处理附件部分 ===")
-            
-            # 规则1：跳过表格中的段落
-            if has_table(paragraph):
-                skipped_table += 1
-                continue
-            
-            # 规则2：图片段落只居中，不做其他处理
-            if has_image(paragraph):
-                center_image_paragraph(paragraph)
-                processed_image += 1
-                print(f"  🖼️  图片: 已居中对齐")
-                continue
-            
-            # 附件部分的处理逻辑
-            if in_attachment:
-                # 附件标记本身：左上角顶格、3号黑体
-                if is_attachment_marker(text):
-                    # ⭐附件标记：左对齐顶格
-                    paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    paragraph.paragraph_format.first_line_indent = Pt(0)  # 顶格
-                    paragraph.paragraph_format.left_indent = Pt(0)
-                    
-                    for run in paragraph.runs:
-                        run.font.name = '黑体'
-                        if run._element.rPr is not None:
-                            run._element.rPr.rFonts.set(qn('w:eastAsia'), '黑体')
-                        run.font.size = Pt(16)  # 3号字
-                        run.font.bold = True
-                        run.font.italic = False  # 清除斜体
-                        run.font.color.rgb = RGBColor(0, 0, 0)
-                    
-                    # ⭐在附件标记前插入分页符（换页）
-                    if current_index > 0:
-                        from docx.oxml import OxmlElement
-                        from docx.oxml.ns import qn as qn_ns
-                        # 在当前段落的第一个run前插入分页符
-                        if paragraph.runs:
-                            run = paragraph.runs[0]
-                        else:
-                            run = paragraph.add_run()
-                        
-                        # 创建分页符元素
-                        br = OxmlElement('w:br')
-                        br.set(qn('w:type'), 'page')
-                        
-                        # 插入到run的开头
-                        run._element.insert(0, br)
-                    
-                    print(f"  📎 附件标记（换页）: {text[:30]}")
-                    continue
+        def formattable_paragraphs(indices):
+            """依次给出需要按规则设置格式的 (序号, 段落)：表格中的段落跳过，图片段落只居中，两段循环共用"""
+            nonlocal paragraph_count, skipped_table, processed_image
+            for current_index in indices:
+                paragraph = paragraphs_list[current_index]
+                paragraph_count += 1
                 
-                # 附件中的主标题（附件的文档标题）
-                # ⭐改进：不使用is_title判断，而是检查是否是附件标记后的第一个非空段落
-                if not attachment_title_found:
-                    # 检查是否像标题（包含文种词或者字数较短）
-                    title_keywords = ['通知', '报告', '决定', '意见', '办法', '方案', '规定', '通报', '请示', '批复', '函', '纪要', '制度', '汇编', '计划', '总结']
-                    is_likely_title = any(kw in text for kw in title_keywords) or len(text) <= 30
-                    
-                    # 排除一级标题格式
-                    has_standard_heading = get_heading_level(text) is not None
-                    
-                    if is_likely_title and not has_standard_heading:
-                        apply_paragraph_format(paragraph, 'title')
-                        print(f"  📌 [附件]标题: {text[:30]}...")
-                        attachment_title_found = True
-                        continue
-                
-                # 附件中的标题级别判断
-                heading_level = get_heading_level(text)
-                if not heading_level:
-                    heading_level = detect_heading_after_numbering_removed(text)
+                # 规则1：跳过表格中的段落
+                if has_table(paragraph, table_paragraphs):
+                    skipped_table += 1
+                    continue
                 
-                if heading_level == 1:
-                    apply_paragraph_format(paragraph, 'heading1')
-                    print(f"  🔹 [附件]一级标题: {text[:30]}")
-                elif heading_level == 2:
-                    apply_paragraph_format(paragraph, 'heading2')
-                    print(f"    🔸 [附件]二级标题: {text[:30]}")
-                elif heading_level == 3:
-                    apply_paragraph_format(paragraph, 'heading3')
-                    print(f"      ▪️  [附件]三级标题: {text[:30]}")
-                elif heading_level == 4:
-                    apply_paragraph_format(paragraph, 'heading4')
-                    print(f"        • [附件]四级标题: {text[:30]}")
-                else:
-                    apply_paragraph_format(paragraph, 'body')
-                    if paragraph_count % 10 == 0:
-                        print(f"  ✓ [附件]已处理 {paragraph_count}/{total} 个段落")
+                # 规则2：图片段落只居中，不做其他处理
+                if has_image(paragraph):
+                    center_image_paragraph(paragraph)
+                    processed_image += 1
+                    print(f"  🖼️  图片: 已居中对齐")
+                    continue
                 
-                continue
+                yield current_index, paragraph
+        
+        # 附件标记之前为正文、之后为附件，分两段循环处理，不再逐段判断是否进入附件
+        main_end = attachment_start_index if attachment_start_index is not None else total
+        
+        # 正文部分
+        for current_index, paragraph in formattable_paragraphs(range(main_end)):
+            text = cache.texts[current_index]
             
             # 正文部分的处理逻辑（原有逻辑）
             # 判断主标题
@@ -1383,18 +1338,12 @@ def format_document(input_path):
                 # ⭐⭐⭐ 标题和主送机关之间需要空一行
                 # 检查下一段是否是主送机关
                 if current_index + 1 < len(paragraphs_list):
-                    next_para = paragraphs_list[current_index + 1]
-                    next_text = next_para.text.strip()
+                    next_text = cache.texts[current_index + 1]
                     if is_recipient(next_text):
                         # 在标题后插入一个空行
-                        # 获取标题段落在文档中的位置
-                        title_element = paragraph._element
-                        parent = title_element.getparent()
-                        title_idx = list(parent).index(title_element)
-                        # 在标题后插入空段落
-                        from docx.oxml import OxmlElement
+                        # 直接插入为标题段落的下一个兄弟元素，不需要查找标题在文档中的位置
                         new_p = OxmlElement('w:p')
-                        parent.insert(title_idx + 1, new_p)
+                        paragraph._element.addnext(new_p)
                         print(f"  ✓ 在标题和主送机关之间插入空行")
                 
                 continue
@@ -1407,7 +1356,7 @@ def format_document(input_path):
                 continue
             
             # 判断署名和日期（优先级提高，在标题判断之前）
-            sig_or_date = is_signature_or_date(paragraphs_list, current_index)
+            sig_or_date = is_signature_or_date(paragraphs_list, current_index, cache.texts)
             if sig_or_date == 'signature':
                 apply_paragraph_format(paragraph, 'signature')
                 print(f"  ✍️  署名: {text[:30]}")
@@ -1424,53 +1373,23 @@ def format_document(input_path):
                 continue
             
             # ⭐判断附件列表（已规范化格式）
-            import re
             # ⭐⭐⭐ 关键：使用原始文本（不strip），保留前导空格
-            raw_text = paragraph.text
+            raw_text = cache.raw_texts[current_index]
             
             # 格式1: "附件：1.XX"（第一行）
-            if re.match(r'^附件[：:]\d+\.', text):
+            # 先用开头文字粗筛，不可能匹配的段落不调用正则
+            if text.startswith('附件') and _ATTACH_LIST_FIRST_NORMALIZED.match(text):
                 # ⭐不能用apply_paragraph_format，因为它会删除前导空格
-                # 直接设置格式
-                
-                # 段落格式：和正文一样，首行缩进2字符
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                paragraph.paragraph_format.first_line_indent = Pt(32)  # 2字符缩进
-                paragraph.paragraph_format.left_indent = Pt(0)
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
-                paragraph.paragraph_format.line_spacing = Pt(28)
-                
-                # 字体格式（仿宋16磅）
-                for run in paragraph.runs:
-                    run.font.name = '仿宋_GB2312'
-                    run._element.rPr.rFonts.set(qn('w:eastAsia'), '仿宋_GB2312')
-                    run.font.size = Pt(16)
-                    run.font.bold = False
-                    run.font.color.rgb = RGBColor(0, 0, 0)
+                apply_attachment_list_format(paragraph)
                 
                 print(f"  📎 附件列表第一项: {text[:30]}")
                 continue
             
             # 格式2: "      2.XX"（后续行，6个空格开头）
             # ⭐使用raw_text检测前导空格
-            if re.match(r'^\s{6}\d+\.', raw_text):
+            if raw_text[:1].isspace() and _ATTACH_LIST_ITEM.match(raw_text):
                 # ⭐不能用apply_paragraph_format，因为它会删除前导空格
-                # 直接设置格式
-                
-                # 段落格式：和正文一样，首行缩进2字符
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                paragraph.paragraph_format.first_line_indent = Pt(32)  # 2字符缩进
-                paragraph.paragraph_format.left_indent = Pt(0)
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
-                paragraph.paragraph_format.line_spacing = Pt(28)
-                
-                # 字体格式（仿宋16磅）
-                for run in paragraph.runs:
-                    run.font.name = '仿宋_GB2312'
-                    run._element.rPr.rFonts.set(qn('w:eastAsia'), '仿宋_GB2312')
-                    run.font.size = Pt(16)
-                    run.font.bold = False
-                    run.font.color.rgb = RGBColor(0, 0, 0)
+                apply_attachment_list_format(paragraph)
                 
                 print(f"  📎 附件列表项: {text.strip()[:30]}")
                 continue
@@ -1486,7 +1405,7 @@ def format_document(input_path):
             # 如果在附件列表中，检测列表项（如"2、XX"、"  2、XX"等）
             if in_attachment_list:
                 # 判断是否是列表项：以数字+顿号开头，或前面有空格缩进
-                is_list_item = re.match(r'^\s*\d+[、，]', text)
+                is_list_item = text[:1].isdigit() and _LEGACY_LIST_ITEM.match(text)
                 if is_list_item:
                     apply_paragraph_format(paragraph, 'body')
                     print(f"  📎 附件列表项: {text[:30]}")
@@ -1501,23 +1420,87 @@ def format_document(input_path):
                 # 移除自动编号后，可能需要智能推断
                 heading_level = detect_heading_after_numbering_removed(text)
             
-            if heading_level == 1:
-                apply_paragraph_format(paragraph, 'heading1')
-                print(f"  🔹 一级标题: {text[:30]}")
-            elif heading_level == 2:
-                apply_paragraph_format(paragraph, 'heading2')
-                print(f"    🔸 二级标题: {text[:30]}")
-            elif heading_level == 3:
-                apply_paragraph_format(paragraph, 'heading3')
-                print(f"      ▪️  三级标题: {text[:30]}")
-            elif heading_level == 4:
-                apply_paragraph_format(paragraph, 'heading4')
-                print(f"        • 四级标题: {text[:30]}")
+            heading = _HEADING_DISPATCH.get(heading_level)
+            if heading:
+                style_name, icon, label = heading
+                apply_paragraph_format(paragraph, style_name)
+                print(f"{icon}{label}: {text[:30]}")
             else:
                 apply_paragraph_format(paragraph, 'body')
                 if paragraph_count % 10 == 0:
                     print(f"  ✓ 已处理 {paragraph_count}/{total} 个段落")
         
+        # 附件部分
+        if main_end < total:
+            print(f"\n  📎 === 开始处理附件部分 ===")
+        for current_index, paragraph in formattable_paragraphs(range(main_end, total)):
+            text = cache.texts[current_index]
+            
+            # 附件部分的处理逻辑
+            # 附件标记本身：左上角顶格、3号黑体
+            if is_attachment_marker(text):
+                # ⭐附件标记：左对齐顶格
+                paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
+                paragraph.paragraph_format.first_line_indent = Pt(0)  # 顶格
+                paragraph.paragraph_format.left_indent = Pt(0)
+                
+                for run in paragraph.runs:
+                    run.font.name = '黑体'
+                    if run._element.rPr is not None:
+                        run._element.rPr.rFonts.set(qn('w:eastAsia'), '黑体')
+                    run.font.size = Pt(16)  # 3号字
+                    run.font.bold = True
+                    run.font.italic = False  # 清除斜体
+                    run.font.color.rgb = RGBColor(0, 0, 0)
+                
+                # ⭐在附件标记前插入分页符（换页）
+                if current_index > 0:
+                    # 在当前段落的第一个run前插入分页符
+                    if paragraph.runs:
+                        run = paragraph.runs[0]
+                    else:
+                        run = paragraph.add_run()
+                    
+                    # 创建分页符元素
+                    br = OxmlElement('w:br')
+                    br.set(qn('w:type'), 'page')
+                    
+                    # 插入到run的开头
+                    run._element.insert(0, br)
+                
+                print(f"  📎 附件标记（换页）: {text[:30]}")
+                continue
+            
+            # 附件中的主标题（附件的文档标题）
+            # ⭐改进：不使用is_title判断，而是检查是否是附件标记后的第一个非空段落
+            if not attachment_title_found:
+                # 检查是否像标题（包含文种词或者字数较短）
+                is_likely_title = _ATTACHMENT_TITLE_RE.search(text) is not None or len(text) <= 30
+                
+                # 排除一级标题格式
+                has_standard_heading = get_heading_level(text) is not None
+                
+                if is_likely_title and not has_standard_heading:
+                    apply_paragraph_format(paragraph, 'title')
+                    print(f"  📌 [附件]标题: {text[:30]}...")
+                    attachment_title_found = True
+                    continue
+            
+            # 附件中的标题级别判断
+            heading_level = get_heading_level(text)
+            if not heading_level:
+                heading_level = detect_heading_after_numbering_removed(text)
+            
+            heading = _HEADING_DISPATCH.get(heading_level)
+            if heading:
+                style_name, icon, label = heading
+                apply_paragraph_format(paragraph, style_name)
+                print(f"{icon}[附件]{label}: {text[:30]}")
+            else:
+                apply_paragraph_format(paragraph, 'body')
+                if paragraph_count % 10 == 0:
+                    print(f"  ✓ [附件]已处理 {paragraph_count}/{total} 个段落")
+        
         print(f"  ✓ 全部 {total} 个段落处理完成")
         
         # 统计信息
@@ -1527,9 +1510,10 @@ def format_document(input_path):
             print(f"  🖼️  处理图片: {processed_image} 个（已居中）")
         
         # 5. 保存文档
-        dir_name = os.path.dirname(input_path)
-        base_name = os.path.basename(input_path)
-        output_path = os.path.join(dir_name, f"done_{base_name}")
+        if output_path is None:
+            dir_name = os.path.dirname(input_path)
+            base_name = os.path.basename(input_path)
+            output_path = os.path.join(dir_name, f"done_{base_name}")
         
         print(f"  💾 保存文档...")
         doc.save(output_path)
@@ -1546,6 +1530,15 @@ def format_document(input_path):
         traceback.print_exc()
         return False
 
+def clean_input_path(user_input):
+    """处理拖拽或粘贴的文件路径
+    
+    1. 去除首尾的引号（单引号或双引号）
+    2. 去除macOS拖拽时的反斜杠转义（如：测试\\ 文件.docx），空格、括号、&前的反斜杠一次替换
+    """
+    file_path = user_input.strip('"').strip("'").strip()
+    return _PATH_ESCAPE_RE.sub(r'\1', file_path)
+
 def main():
     """
     主函数 - 命令行交互
@@ -1570,17 +1563,7 @@ def main():
                 break
             
             # 处理路径（支持多种格式）
-            # 1. 去除首尾的引号（单引号或双引号）
-            file_path = user_input.strip('"').strip("'").strip()
-            
-            # 2. 处理macOS拖拽时的反斜杠转义（如：测试\ 文件.docx）
-            # 将 "\ " 替换为 " "（空格前的反斜杠是转义符）
-            file_path = file_path.replace('\\ ', ' ')
-            
-            # 3. 处理其他常见的转义字符
-            file_path = file_path.replace('\\(', '(').replace('\\)', ')')
-            file_path = file_path.replace('\\[', '[').replace('\\]', ']')
-            file_path = file_path.replace('\\&', '&')
+            file_path = clean_input_path(user_input)
             
             # 检查文件
             if not file_path:
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn 配置 - Web版生产部署
+用法: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import os
+
+# 监听地址（可用环境变量 PORT 修改端口）
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# 任务状态保存在进程内（见 tasks.py），/status 轮询必须落到提交任务的同一进程，
+# 因此只用1个worker，并发由线程和后台任务池提供
+workers = 1
+worker_class = 'gthread'
+threads = 8
+
+# LLM 增强模式单次调用可能较慢
+timeout = 300
+
+# 不在主进程中预加载应用：格式化进程池在worker中创建，fork 前创建的进程池无法在worker中使用
+# （预热由进程池子进程各自完成）
+preload_app = False
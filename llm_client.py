@@ -4,30 +4,240 @@
 Ollama 客户端 - 调用本地 Qwen 模型
 """
 
+import os
+import copy
+import time
+import hashlib
+import threading
 import requests
 import json
-from config import OLLAMA_CONFIG
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+from config import OLLAMA_CONFIG, CACHE_CONFIG
+
+# orjson（可选）：C实现的JSON解析和序列化，未安装时使用标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# 共享的HTTP连接池：所有客户端复用与 Ollama 的 TCP 连接，避免每次调用重新握手
+# 连接失败时自动重试2次（POST请求已发出后不重试，避免重复推理）
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, pool_block=False,
+                       max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.2))
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+_JSON_HEADERS = {'Content-Type': 'application/json'}
+PARAGRAPH_TYPES = frozenset({
+    'title', 'recipient', 'heading1', 'heading2', 'heading3', 'heading4',
+    'body', 'attachment_marker', 'signature', 'date'
+})  # LLM可输出的段落类型
+_TOKENS_PER_LINE = 24  # 输出JSON中每段约占的token数（index、type及括号引号约16个，留出换行缩进等余量）
+_TOKENS_RESERVED = 128  # 输出JSON外层结构及前后多余文字预留的token数
+
+
+def json_dumps(obj):
+    """序列化为JSON字节串（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def json_loads(data):
+    """解析JSON（优先使用orjson），解析失败时抛出 json.JSONDecodeError"""
+    if orjson is not None:
+        return orjson.loads(data)  # orjson.JSONDecodeError 是 json.JSONDecodeError 的子类
+    return json.loads(data)
+
+
+# 识别结果缓存：相同模型、相同Prompt直接返回上次的识别结果（保存JSON字节串，每次返回新解析的对象）
+_result_cache = OrderedDict()  # 进程内LRU：键 -> JSON字节串
+_result_cache_lock = threading.Lock()
+_result_file_count = None  # 磁盘缓存文件数的估计值：扫描目录时得到，之后每保存一次加1，超过上限时才重新扫描
+
+
+def is_complete_result(result):
+    """识别结果是否完整：段落列表非空，每项都有整数行号和有效类型（只有完整的结果才写入缓存）"""
+    paragraphs = result.get("paragraphs") if isinstance(result, dict) else None
+    return (isinstance(paragraphs, list) and len(paragraphs) > 0
+            and all(isinstance(item, dict) and isinstance(item.get("index"), int)
+                    and isinstance(item.get("type"), str) and item["type"] in PARAGRAPH_TYPES
+                    for item in paragraphs))
+
+
+def result_cache_key(model, prompt):
+    """识别结果缓存的键：模型名和Prompt的blake2b摘要"""
+    return hashlib.blake2b(f'{model}\n{prompt}'.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_cached_result(key):
+    """读取缓存的识别结果（先查进程内缓存，再查磁盘），没有时返回None"""
+    with _result_cache_lock:
+        data = _result_cache.get(key)
+        if data is not None:
+            _result_cache.move_to_end(key)
+    if data is None:
+        cache_dir = CACHE_CONFIG["result_cache_dir"]
+        if not cache_dir:
+            return None
+        try:
+            with open(os.path.join(cache_dir, f'{key}.json'), 'rb') as f:
+                data = f.read()
+            result = json_loads(data)
+        except (OSError, ValueError):
+            return None
+        if not is_complete_result(result):
+            # 旧版本写入的不完整结果，不再使用
+            return None
+        _remember_result(key, data)
+        return result
+    return json_loads(data)
+
+
+def store_cached_result(key, result):
+    """保存识别结果到进程内缓存和磁盘，磁盘文件超出数量上限时删除最久未用的"""
+    data = json_dumps(result)
+    _remember_result(key, data)
+    
+    cache_dir = CACHE_CONFIG["result_cache_dir"]
+    if not cache_dir:
+        return
+    tmp_path = os.path.join(cache_dir, f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(cache_dir, f'{key}.json'))
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+    
+    global _result_file_count
+    with _result_cache_lock:
+        if _result_file_count is not None:
+            _result_file_count += 1
+            if _result_file_count <= CACHE_CONFIG["result_cache_max_files"]:
+                return
+        _result_file_count = 0  # 扫描期间其他线程只累加，不重复扫描
+    _prune_result_files(cache_dir)
+
+
+def _prune_result_files(cache_dir):
+    """扫描磁盘缓存目录，文件数超出上限时删除最久未用的，多删一成留出余量，避免之后每次保存都重新扫描"""
+    global _result_file_count
+    max_files = CACHE_CONFIG["result_cache_max_files"]
+    try:
+        entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith('.json')]
+        if len(entries) > max_files:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            excess = len(entries) - max_files * 9 // 10
+            for entry in entries[:excess]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass  # 其他进程已删除
+            entries = entries[excess:]
+    except OSError:
+        entries = ()
+    with _result_cache_lock:
+        _result_file_count += len(entries)
+
+
+def _remember_result(key, data):
+    """放入进程内LRU缓存"""
+    with _result_cache_lock:
+        _result_cache[key] = data
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > CACHE_CONFIG["result_cache_size"]:
+            _result_cache.popitem(last=False)
+
+
+def format_lines(lines, labels=None):
+    """把 [(行号, 内容), ...] 拼成发送给LLM的文本（每行"行号: 内容"）
+    
+    labels 为 {行号: 标记}，带标记的行写成"行号: [标记] 内容"，只作上下文，LLM不再输出这些行
+    """
+    if not labels:
+        return "\n".join(f"{index}: {content}" for index, content in lines)
+    return "\n".join(f"{index}: [{labels[index]}] {content}" if index in labels else f"{index}: {content}"
+                     for index, content in lines)
+
+
+def extract_json_text(response_text):
+    """提取被包裹在其他文字中的JSON：从第一个"{"到最后一个"}"，找不到时返回原文"""
+    start = response_text.find('{')
+    end = response_text.rfind('}')
+    if start == -1 or end < start:
+        return response_text
+    return response_text[start:end + 1]
+
+
+# 文档结构识别 Prompt：固定的规则说明 + 文档内容 + 固定的结尾
+_PROMPT_PREFIX = """你是公文结构识别专家。按GB/T 9704-2012判断下面每一行（行号: 内容）的段落类型：
+title 标题：含通知、报告、决定、意见、办法、方案等文种词，通常在前3行
+recipient 主送机关：以"："结尾，含局、委、厅、部、各等
+heading1 一级标题："一、"开头，或含加强、推进等动词的6-20字短语
+heading2 二级标题："（一）"开头
+heading3 三级标题："1."开头（半角点）
+heading4 四级标题："(1)"开头（半角括号）
+body 正文：叙述性文字、表格图片说明，不确定时也用body
+attachment_marker 附件标记：单独一行的"附件："、"附件1："
+signature 署名：单位名称，在日期前一行
+date 日期：年月日，在文档末尾
+附件标记后标题编号重新开始；符合多个类型时选更具体的（标题>正文）。
+内容前带[类型]的行类型已确定，[同N]的行与第N行类型相同，这些行只作上下文参考，不要输出。
+只输出一个JSON对象，不要其他文字，不要输出段落内容：
+{"paragraphs":[{"index":行号,"type":类型}],"attachment_start_index":附件标记的行号，没有附件为-1}
+
+"""
+_PROMPT_SUFFIX = """
+
+JSON："""
+# Prompt固定部分的摘要：Prompt改动后，按上传内容缓存的LLM格式化结果随之失效
+PROMPT_DIGEST = hashlib.blake2b((_PROMPT_PREFIX + _PROMPT_SUFFIX).encode('utf-8'), digest_size=8).hexdigest()
 
 
 class OllamaClient:
     """Ollama 本地大模型客户端"""
     
-    def __init__(self, base_url=None, model=None):
+    def __init__(self, base_url=None, model=None, log=print):
         self.base_url = base_url or OLLAMA_CONFIG["base_url"]
         self.model = model or OLLAMA_CONFIG["model"]
         self.temperature = OLLAMA_CONFIG["temperature"]
         self.timeout = OLLAMA_CONFIG["timeout"]
+        self.connect_timeout = OLLAMA_CONFIG["connect_timeout"]
+        self.keep_alive = OLLAMA_CONFIG["keep_alive"]
+        self.num_ctx = OLLAMA_CONFIG["num_ctx"]
+        self.num_predict = OLLAMA_CONFIG["num_predict"]
+        self.request_timeout = OLLAMA_CONFIG["request_timeout"]
+        self.max_retries = OLLAMA_CONFIG["max_retries"]
+        self.chunk_lines = OLLAMA_CONFIG["chunk_lines"]
+        self.chunk_overlap = OLLAMA_CONFIG["chunk_overlap"]
+        self.parallel_requests = OLLAMA_CONFIG["parallel_requests"]
+        self.warmup = OLLAMA_CONFIG["warmup"]
+        self.last_stats = None  # 最近一次调用的token统计
+        self.log = log  # 进度输出（批量处理时写入各文档自己的缓冲区）
     
     def check_connection(self):
-        """检查 Ollama 是否运行"""
+        """检查 Ollama 是否运行（找到模型后预先加载模型）"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = _session.get(f"{self.base_url}/api/tags", timeout=(self.connect_timeout, 5))
             if response.status_code == 200:
                 models = response.json().get("models", [])
                 model_names = [m["name"] for m in models]
                 
                 # 检查目标模型是否存在
                 if self.model in model_names:
+                    if self.warmup:
+                        self.load_model()
                     return True, f"✅ Ollama运行正常，找到模型: {self.model}"
                 else:
                     return False, f"❌ 模型 {self.model} 不存在。可用模型: {', '.join(model_names)}"
@@ -38,50 +248,74 @@ class OllamaClient:
         except Exception as e:
             return False, f"❌ 连接检查失败: {str(e)}"
     
+    def load_model(self):
+        """预先加载模型：发送空Prompt，Ollama只加载模型不生成内容，第一次识别不再等待模型加载
+        
+        num_ctx 与识别时相同，否则识别时Ollama会按新的上下文窗口重新加载模型；加载失败时忽略
+        """
+        payload = json_dumps({
+            "model": self.model,
+            "prompt": "",
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"num_ctx": self.num_ctx}
+        })
+        try:
+            _session.post(
+                f"{self.base_url}/api/generate",
+                data=payload,
+                headers=_JSON_HEADERS,
+                timeout=(self.connect_timeout, self.timeout)
+            ).close()
+        except requests.exceptions.RequestException:
+            pass
+    
+    def estimate_num_predict(self, document_text):
+        """按文档行数估算输出token上限（不超过配置的 num_predict）
+        
+        输出的JSON不复述原文，每行只有 index、type 两个字段
+        """
+        line_count = document_text.count('\n') + 1
+        return min(self.num_predict, _TOKENS_PER_LINE * line_count + _TOKENS_RESERVED)
+    
     def analyze_document(self, document_text):
-        """调用 Qwen 模型分析文档结构"""
+        """调用 Qwen 模型分析文档结构（相同内容直接返回缓存的识别结果）
+        
+        按估算的输出上限返回的JSON不完整时，用配置的 num_predict 重新调用一次
+        """
         prompt = self._build_prompt(document_text)
+        cache_key = result_cache_key(self.model, prompt)
+        cached_result = load_cached_result(cache_key)
+        if cached_result is not None:
+            self.last_stats = None
+            self.log("     ♻️  相同内容已识别过，使用缓存的识别结果")
+            return cached_result
         
+        num_predict = self.estimate_num_predict(document_text)
         try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "temperature": self.temperature,
-                    "options": {
-                        "temperature": self.temperature,
-                        "num_predict": 4096  # 最大输出token数
-                    }
-                },
-                timeout=self.timeout
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Ollama API 调用失败: HTTP {response.status_code}")
-            
-            result = response.json()
-            response_text = result.get("response", "")
-            
-            if not response_text:
-                raise Exception("Ollama 返回空结果")
-            
-            # 解析 JSON 响应
-            try:
-                # 尝试提取 JSON（可能被包裹在其他文字中）
-                import re
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    parsed_result = json.loads(json_str)
-                else:
-                    parsed_result = json.loads(response_text)
+            while True:
+                response_text = self._generate(prompt, num_predict)
                 
-                return parsed_result
+                if not response_text:
+                    raise Exception("Ollama 返回空结果")
+                
+                # 解析 JSON 响应
+                try:
+                    # 尝试提取 JSON（可能被包裹在其他文字中）
+                    parsed_result = json_loads(extract_json_text(response_text))
+                except json.JSONDecodeError as e:
+                    if num_predict < self.num_predict:
+                        # 输出可能在达到估算的token上限时被截断
+                        self.log(f"     ⚠️  返回的JSON不完整，按输出上限 {self.num_predict} tokens 重新调用...")
+                        num_predict = self.num_predict
+                        continue
+                    raise Exception(f"无法解析 LLM 返回的 JSON: {str(e)}\n返回内容: {response_text[:500]}")
                 
-            except json.JSONDecodeError as e:
-                raise Exception(f"无法解析 LLM 返回的 JSON: {str(e)}\n返回内容: {response_text[:500]}")
+                # 只缓存完整的结果，不完整的结果下次重新调用模型
+                if is_complete_result(parsed_result):
+                    store_cached_result(cache_key, parsed_result)
+                
+                return parsed_result
         
         except requests.exceptions.Timeout:
             raise Exception(f"LLM 调用超时（超过 {self.timeout} 秒）")
@@ -90,51 +324,189 @@ class OllamaClient:
         except Exception as e:
             raise Exception(f"LLM 调用失败: {str(e)}")
     
+    def _generate(self, prompt, num_predict):
+        """发送一次生成请求，返回模型输出的文本；超时后按 max_retries 重新发送"""
+        payload = json_dumps({
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,  # 流式返回，JSON结束后即可停止读取
+            "keep_alive": self.keep_alive,  # 调用结束后模型继续驻留
+            "temperature": self.temperature,
+            "options": {
+                "temperature": self.temperature,
+                "num_ctx": self.num_ctx,  # 上下文窗口，过小时长文档会被截断
+                "num_predict": num_predict  # 最大输出token数
+            }
+        })
+        
+        # 前几次使用较短的超时，超时后断开并重新发送；最后一次使用完整的超时时间
+        # 流式返回时超时指等待下一段输出的最长时间
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            read_timeout = self.timeout if is_last else self.request_timeout
+            try:
+                response = _session.post(
+                    f"{self.base_url}/api/generate",
+                    data=payload,
+                    headers=_JSON_HEADERS,
+                    stream=True,
+                    timeout=(self.connect_timeout, read_timeout)  # 连接超时与等待推理结果的超时分开设置
+                )
+                with response:
+                    if response.status_code != 200:
+                        raise Exception(f"Ollama API 调用失败: HTTP {response.status_code}")
+                    return self._read_stream(response)
+            except requests.exceptions.ReadTimeout:
+                if is_last:
+                    raise
+                self.log(f"     ⏱️  第{attempt + 1}次调用超过 {read_timeout} 秒未返回，重新发送...")
+    
+    def _read_stream(self, response):
+        """逐段读取流式输出，最外层JSON对象的"}"出现后立即停止读取（关闭连接后Ollama停止生成）
+        
+        在字符串外统计花括号深度判断JSON是否结束；返回拼接的输出文本，并记录token统计
+        """
+        started = time.monotonic()
+        parts = []
+        depth = 0
+        in_string = False
+        escaped = False
+        chunk_count = 0
+        complete = False  # 最外层JSON对象是否已结束
+        final = None  # Ollama 最后一段（done=true）附带的统计信息
+        
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json_loads(line)
+                if "error" in chunk:
+                    raise Exception(f"Ollama 返回错误: {chunk['error']}")
+                
+                if complete:
+                    # JSON结束后只再读一段：通常紧接着就是附带统计信息的最后一段，否则不再等待
+                    if chunk.get("done"):
+                        final = chunk
+                    break
+                
+                fragment = chunk.get("response", "")
+                chunk_count += 1
+                for pos, char in enumerate(fragment):
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif char == '\\':
+                            escaped = True
+                        elif char == '"':
+                            in_string = False
+                    elif char == '"':
+                        in_string = depth > 0
+                    elif char == '{':
+                        depth += 1
+                    elif char == '}' and depth > 0:
+                        depth -= 1
+                        if depth == 0:
+                            fragment = fragment[:pos + 1]  # JSON已完整，丢弃之后的输出
+                            complete = True
+                            break
+                parts.append(fragment)
+                
+                if chunk.get("done"):
+                    final = chunk
+                    break
+        except requests.exceptions.ConnectionError as e:
+            # 流式读取中的读超时会被requests包装为ConnectionError，还原为超时以便重新发送
+            if e.args and isinstance(e.args[0], ReadTimeoutError):
+                raise requests.exceptions.ReadTimeout(e)
+            raise
+        
+        # 记录token统计（Ollama 的耗时单位为纳秒），用于判断瓶颈在模型推理还是调用开销
+        # 提前停止时没有Ollama的统计，按收到的输出段数（约每段一个token）和实际耗时估算
+        if final is not None:
+            eval_count = final.get("eval_count", 0)
+            eval_duration = final.get("eval_duration", 0)
+            self.last_stats = {
+                "prompt_tokens": final.get("prompt_eval_count", 0),
+                "output_tokens": eval_count,
+                "tokens_per_second": eval_count / (eval_duration / 1e9) if eval_duration else 0.0,
+                "total_seconds": final.get("total_duration", 0) / 1e9
+            }
+        else:
+            total_seconds = time.monotonic() - started
+            self.last_stats = {
+                "prompt_tokens": 0,
+                "output_tokens": chunk_count,
+                "tokens_per_second": chunk_count / total_seconds if total_seconds else 0.0,
+                "total_seconds": total_seconds
+            }
+        
+        return ''.join(parts)
+    
+    def analyze_lines(self, lines, labels=None):
+        """分析文档结构，lines 为 [(行号, 内容), ...]
+        
+        labels 为 {行号: 标记}：已确定类型的行（标记为类型）或与前面某行相同的行（标记为"同N"），
+        这些行仍发送给LLM作为上下文，但不采用其识别结果
+        
+        行数不超过 chunk_lines 时一次调用；否则切分为多个窗口（每个窗口前面带 chunk_overlap 行上文），
+        多个窗口并发调用，再按行号合并结果，每行只采用负责该行的窗口的识别结果；没有待识别行的窗口不发送
+        """
+        labels = labels or {}
+        windows = []  # [(发送的文本, 本窗口负责的行号集合, 本窗口负责的待识别行号集合), ...]
+        for start in range(0, len(lines), self.chunk_lines):
+            owned_lines = lines[start:start + self.chunk_lines]
+            pending_indices = {index for index, _ in owned_lines if index not in labels}
+            if not pending_indices:
+                continue
+            context_lines = lines[max(0, start - self.chunk_overlap):start]
+            windows.append((format_lines(context_lines + owned_lines, labels),
+                            {index for index, _ in owned_lines}, pending_indices))
+        
+        if len(windows) == 1:
+            window_results = [(self.analyze_document(windows[0][0]), self.last_stats)]
+            started = None
+        else:
+            def analyze_window(window_text):
+                # 每个窗口使用独立的客户端副本，各自记录token统计
+                client = copy.copy(self)
+                return client.analyze_document(window_text), client.last_stats
+            
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=max(1, min(self.parallel_requests, len(windows)))) as executor:
+                window_results = list(executor.map(analyze_window, [text for text, _, _ in windows]))
+        
+        # 按行号合并各窗口的结果
+        paragraphs = []
+        attachment_start_index = -1
+        prompt_tokens = output_tokens = 0
+        for (_, owned_indices, pending_indices), (result, stats) in zip(windows, window_results):
+            paragraphs.extend(item for item in result.get("paragraphs", [])
+                              if isinstance(item, dict) and isinstance(item.get("index"), int)
+                              and item["index"] in pending_indices)
+            window_attachment = result.get("attachment_start_index", -1)
+            if attachment_start_index == -1 and isinstance(window_attachment, int) and window_attachment in owned_indices:
+                attachment_start_index = window_attachment
+            if stats:
+                prompt_tokens += stats["prompt_tokens"]
+                output_tokens += stats["output_tokens"]
+        
+        if started is not None:
+            total_seconds = time.monotonic() - started
+            self.last_stats = {
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "tokens_per_second": output_tokens / total_seconds if total_seconds else 0.0,  # 并发时的整体速度
+                "total_seconds": total_seconds
+            }
+            self.log(f"     分 {len(windows)} 段并发识别（每段最多 {self.chunk_lines} 行）")
+        return {"paragraphs": paragraphs, "attachment_start_index": attachment_start_index}
+    
     def _build_prompt(self, document_text):
-        """构建用于文档结构识别的 Prompt"""
-        return f"""你是公文结构识别专家。请严格按照GB/T 9704-2012标准分析以下文档，识别每个段落的类型。
-
-【识别规则】
-1. title（标题）: 包含"通知"、"报告"、"决定"、"意见"、"办法"、"方案"等文种词，通常在前3段
-2. recipient（主送机关）: 以"："或":"结尾，包含"局"、"委"、"厅"、"部"、"各"等关键词
-3. heading1（一级标题）: "一、"、"二、"、"三、"开头，或包含关键动词的6-20字短语（如"加强XX"、"推进XX"）
-4. heading2（二级标题）: "（一）"、"（二）"、"（三）"开头
-5. heading3（三级标题）: "1."、"2."、"3."开头（注意是半角点号）
-6. heading4（四级标题）: "(1)"、"(2)"、"(3)"开头（注意是半角括号）
-7. body（正文）: 普通段落，以"为"、"根据"、"按照"、"经"等开头，或正常叙述性文字
-8. attachment_marker（附件标记）: "附件："或"附件1："等，单独一行
-9. signature（署名）: 包含单位名称，位于文档后部，通常在日期前一行
-10. date（日期）: 包含"年月日"格式，位于文档末尾
-
-【重要规则】
-- 附件标记后的内容，标题编号会重新开始
-- 如果一个段落同时符合多个特征，优先选择更具体的类型（如标题>正文）
-- 不确定时标记为body（正文）
-- 表格、图片说明标记为body
-
-【输出格式要求】
-严格按以下JSON格式输出，不要包含任何其他文字或解释：
-{{
-  "paragraphs": [
-    {{"index": 0, "type": "title", "content": "段落内容"}},
-    {{"index": 1, "type": "recipient", "content": "段落内容"}},
-    {{"index": 2, "type": "body", "content": "段落内容"}},
-    {{"index": 3, "type": "heading1", "content": "段落内容"}},
-    ...
-  ],
-  "attachment_start_index": 25
-}}
-
-注意：
-- index 必须与下面文档中的行号一致
-- type 只能是上述10种类型之一
-- content 必须与原文一致
-- attachment_start_index 是附件标记所在的index，如果没有附件则设为-1
-
-【文档内容】（行号: 内容）
-{document_text}
-
-请开始分析，只输出JSON，不要任何额外文字："""
+        """构建用于文档结构识别的 Prompt
+        
+        固定的规则说明放在最前面且每次完全相同，Ollama 可复用上次调用中这部分已计算的KV缓存
+        """
+        return _PROMPT_PREFIX + document_text + _PROMPT_SUFFIX
 
 
 def test_ollama_connection():
@@ -5,92 +5,138 @@ LLM 增强格式化模块
 使用本地 Qwen 模型智能识别文档结构，然后应用格式
 """
 
+import io
 import os
 import sys
+import functools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from docx import Document
 from docx.shared import Pt, RGBColor, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
 from docx.oxml.ns import qn
 
-from llm_client import OllamaClient
-from gongwen_formatter_cli import apply_paragraph_format, has_table, has_image, center_image_paragraph
+from config import OLLAMA_CONFIG, CACHE_CONFIG
+from llm_client import OllamaClient, PARAGRAPH_TYPES
+from rule_classifier import classify_paragraphs, CONFIDENCE_THRESHOLD
+from template_cache import TemplateCache, paragraph_signature, paragraph_position
+from gongwen_formatter_cli import (apply_paragraph_format, build_table_paragraph_set, has_table,
+                                   has_image, center_image_paragraph, clean_input_path)
 
 
-def validate_llm_result(llm_result, doc):
+# 附件标记的格式值（3号黑体、黑色、顶格），只构造一次，每个run直接复用
+_EAST_ASIA = qn('w:eastAsia')
+_MARKER_FONT = '黑体'
+_MARKER_SIZE = Pt(16)
+_BLACK = RGBColor(0, 0, 0)
+_ZERO_PT = Pt(0)
+
+# 段落类型 -> (输出标签, 输出文本后缀)，格式名与类型名相同；body 和 attachment_marker 单独处理
+_TYPE_DISPATCH = {
+    'title': ('  📌 标题', '...'),
+    'recipient': ('  📨 主送机关', ''),
+    'heading1': ('  🔹 一级标题', ''),
+    'heading2': ('    🔸 二级标题', ''),
+    'heading3': ('      ▪️  三级标题', ''),
+    'heading4': ('        • 四级标题', ''),
+    'signature': ('  ✍️  署名', ''),
+    'date': ('  📅 日期', ''),
+}
+
+def validate_llm_result(llm_result, doc, log=print):
     """验证 LLM 识别结果的有效性"""
     try:
         # 检查必需字段
         if "paragraphs" not in llm_result:
-            print("  ❌ LLM结果缺少 'paragraphs' 字段")
+            log("  ❌ LLM结果缺少 'paragraphs' 字段")
             return False
         
         paragraphs = llm_result["paragraphs"]
         if not isinstance(paragraphs, list):
-            print("  ❌ 'paragraphs' 不是列表")
+            log("  ❌ 'paragraphs' 不是列表")
             return False
         
         if len(paragraphs) == 0:
-            print("  ❌ 'paragraphs' 为空")
+            log("  ❌ 'paragraphs' 为空")
             return False
         
         # 检查每个段落的格式
-        valid_types = {
-            'title', 'recipient', 'heading1', 'heading2', 'heading3', 'heading4',
-            'body', 'attachment_marker', 'signature', 'date'
-        }
-        
         for i, para in enumerate(paragraphs):
             if not isinstance(para, dict):
-                print(f"  ❌ 第 {i} 个段落不是字典")
+                log(f"  ❌ 第 {i} 个段落不是字典")
                 return False
             
             if "type" not in para:
-                print(f"  ❌ 第 {i} 个段落缺少 'type' 字段")
+                log(f"  ❌ 第 {i} 个段落缺少 'type' 字段")
                 return False
             
-            if para["type"] not in valid_types:
-                print(f"  ⚠️  第 {i} 个段落类型无效: {para['type']}，将视为body")
+            if para["type"] not in PARAGRAPH_TYPES:
+                log(f"  ⚠️  第 {i} 个段落类型无效: {para['type']}，将视为body")
                 para["type"] = "body"  # 自动修正
             
             if "index" not in para:
-                print(f"  ❌ 第 {i} 个段落缺少 'index' 字段")
+                log(f"  ❌ 第 {i} 个段落缺少 'index' 字段")
                 return False
         
-        print("  ✅ LLM结果验证通过")
+        log("  ✅ LLM结果验证通过")
         return True
         
     except Exception as e:
-        print(f"  ❌ LLM结果验证失败: {str(e)}")
+        log(f"  ❌ LLM结果验证失败: {str(e)}")
         return False
 
 
-def apply_formats_by_llm(doc, llm_result):
-    """根据 LLM 识别结果应用格式（只改格式，不改内容）"""
+def extract_paragraphs(doc):
+    """一次遍历文档段落，返回 (para_map, texts, image_paragraphs)
     
-    # 创建段落索引映射（只包含非空段落）
+    para_map: {有效段落序号: 段落}，有效段落为表格外、不含图片的非空段落，序号即发送给LLM的行号
+    texts: 各有效段落去除首尾空白后的文本
+    image_paragraphs: 表格外的图片段落
+    """
+    table_paragraphs = build_table_paragraph_set(doc)
     para_map = {}
-    valid_para_count = 0
+    texts = []
+    image_paragraphs = []
     
     for para in doc.paragraphs:
         # 跳过表格中的段落
-        if has_table(para):
+        if has_table(para, table_paragraphs):
             continue
         
-        # 跳过图片段落（但要居中）
+        # 图片段落单独记录（格式化时居中）
         if has_image(para):
-            center_image_paragraph(para)
+            image_paragraphs.append(para)
             continue
         
         text = para.text.strip()
         if text:
-            para_map[valid_para_count] = para
-            valid_para_count += 1
+            para_map[len(texts)] = para
+            texts.append(text)
+    
+    return para_map, texts, image_paragraphs
+
+
+def apply_formats_by_llm(doc, llm_result, para_map=None, image_paragraphs=None, log=print):
+    """根据 LLM 识别结果应用格式（只改格式，不改内容）
+    
+    para_map、image_paragraphs 为 extract_paragraphs 的结果，未传入时重新遍历文档
+    """
+    if para_map is None:
+        para_map, _, image_paragraphs = extract_paragraphs(doc)
     
-    print(f"  📊 文档共有 {valid_para_count} 个有效段落")
-    print(f"  🤖 LLM识别了 {len(llm_result['paragraphs'])} 个段落")
+    # 图片段落只居中
+    for para in image_paragraphs or ():
+        center_image_paragraph(para)
+    
+    log(f"  📊 文档共有 {len(para_map)} 个有效段落")
+    log(f"  🤖 LLM识别了 {len(llm_result['paragraphs'])} 个段落")
     
     # 统计各类型数量
-    type_counts = {}
+    type_counts = Counter()
+    
+    # 逐段输出先收集起来，遍历结束后一次写出
+    logs = []
+    log = logs.append
     
     # 遍历 LLM 识别结果
     for item in llm_result['paragraphs']:
@@ -98,167 +144,256 @@ def apply_formats_by_llm(doc, llm_result):
         para_type = item.get('type', 'body')
         
         # 统计
-        type_counts[para_type] = type_counts.get(para_type, 0) + 1
+        type_counts[para_type] += 1
         
         # 检查索引是否有效
-        if index is None or index not in para_map:
+        paragraph = para_map.get(index)
+        if paragraph is None:
             continue
         
-        paragraph = para_map[index]
-        
         # 根据类型应用格式
-        if para_type == 'title':
-            apply_paragraph_format(paragraph, 'title')
-            print(f"  📌 标题: {paragraph.text[:30]}...")
-        
-        elif para_type == 'recipient':
-            apply_paragraph_format(paragraph, 'recipient')
-            print(f"  📨 主送机关: {paragraph.text[:30]}")
-        
-        elif para_type == 'heading1':
-            apply_paragraph_format(paragraph, 'heading1')
-            print(f"  🔹 一级标题: {paragraph.text[:30]}")
-        
-        elif para_type == 'heading2':
-            apply_paragraph_format(paragraph, 'heading2')
-            print(f"    🔸 二级标题: {paragraph.text[:30]}")
-        
-        elif para_type == 'heading3':
-            apply_paragraph_format(paragraph, 'heading3')
-            print(f"      ▪️  三级标题: {paragraph.text[:30]}")
-        
-        elif para_type == 'heading4':
-            apply_paragraph_format(paragraph, 'heading4')
-            print(f"        • 四级标题: {paragraph.text[:30]}")
-        
-        elif para_type == 'signature':
-            apply_paragraph_format(paragraph, 'signature')
-            print(f"  ✍️  署名: {paragraph.text[:30]}")
-        
-        elif para_type == 'date':
-            apply_paragraph_format(paragraph, 'date')
-            print(f"  📅 日期: {paragraph.text[:30]}")
-        
-        elif para_type == 'attachment_marker':
+        if para_type == 'attachment_marker':
             # 附件标记：左对齐顶格、3号黑体
             paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-            paragraph.paragraph_format.first_line_indent = Pt(0)
-            paragraph.paragraph_format.left_indent = Pt(0)
+            paragraph_format = paragraph.paragraph_format
+            paragraph_format.first_line_indent = _ZERO_PT
+            paragraph_format.left_indent = _ZERO_PT
             
             for run in paragraph.runs:
-                run.font.name = '黑体'
-                if run._element.rPr is not None:
-                    run._element.rPr.rFonts.set(qn('w:eastAsia'), '黑体')
-                run.font.size = Pt(16)
-                run.font.bold = True
-                run.font.italic = False
-                run.font.color.rgb = RGBColor(0, 0, 0)
+                font = run.font
+                font.name = _MARKER_FONT
+                rPr = run._element.rPr
+                if rPr is not None:
+                    rPr.rFonts.set(_EAST_ASIA, _MARKER_FONT)
+                font.size = _MARKER_SIZE
+                font.bold = True
+                font.italic = False
+                font.color.rgb = _BLACK
             
-            print(f"  📎 附件标记: {paragraph.text[:30]}")
+            log(f"  📎 附件标记: {paragraph.text[:30]}")
+        
+        elif para_type in _TYPE_DISPATCH:
+            apply_paragraph_format(paragraph, para_type)
+            label, suffix = _TYPE_DISPATCH[para_type]
+            log(f"{label}: {paragraph.text[:30]}{suffix}")
         
         else:  # body
             apply_paragraph_format(paragraph, 'body')
     
-    # 打印统计信息
-    print(f"\n  📊 格式化统计:")
-    for ptype, count in sorted(type_counts.items()):
-        print(f"     {ptype}: {count} 个")
+    # 打印逐段输出和统计信息
+    logs.append(f"\n  📊 格式化统计:")
+    logs.extend(f"     {ptype}: {count} 个" for ptype, count in sorted(type_counts.items()))
+    log('\n'.join(logs))
 
 
-def llm_format_document(input_path):
-    """LLM 增强格式化主函数"""
+def llm_format_document(input_path, output_path=None, template_cache=None, log=print):
+    """LLM 增强格式化主函数
+    
+    output_path 为空时输出到输入文件同目录下的 llm_<文件名>；
+    template_cache 为空时从磁盘加载段落模板缓存（批量处理时多个文档共用一个）；
+    log 接收进度输出，默认直接打印
+    """
     try:
-        print(f"\n🤖 [LLM模式] 正在处理: {os.path.basename(input_path)}")
-        print("━" * 50)
-        
-        # 0. 检查 Ollama 连接
-        print("  🔍 检查 Ollama 服务...")
-        client = OllamaClient()
-        success, message = client.check_connection()
-        print(f"     {message}")
-        
-        if not success:
-            raise Exception("Ollama 连接失败，请确保 Ollama 已启动并安装了 qwen2.5:7b 模型")
+        log(f"\n🤖 [LLM模式] 正在处理: {os.path.basename(input_path)}")
+        log("━" * 50)
         
         # 1. 读取文档
-        print("  ⏳ 读取文档...")
+        log("  ⏳ 读取文档...")
         doc = Document(input_path)
         
-        # 2. 提取纯文本（只提取非空段落）
-        print("  📝 提取文档文本...")
-        paragraphs_text = []
+        # 2. 提取纯文本（只提取非空段落），段落只遍历一次，应用格式时复用
+        log("  📝 提取文档文本...")
+        para_map, paragraph_texts, image_paragraphs = extract_paragraphs(doc)
         
-        for para in doc.paragraphs:
-            # 跳过表格中的段落
-            if has_table(para):
+        if len(paragraph_texts) == 0:
+            raise Exception("文档中没有有效文本内容")
+        
+        log(f"     提取了 {len(paragraph_texts)} 个有效段落")
+        
+        # 3. 规则预分类：编号标题、附件标记、日期等格式固定的段落直接确定类型
+        # 其余段落查询段落模板缓存：签名已被LLM多次确认的段落直接复用类型，只把剩下的段落发送给LLM
+        if template_cache is None and CACHE_CONFIG["enabled"]:
+            template_cache = TemplateCache()
+        rule_items = []
+        cached_items = []
+        pending_paragraphs = []
+        pending_signatures = {}  # 发送给LLM的段落序号 -> 签名
+        first_occurrence = {}  # (内容, 所在位置) -> 首次出现的段落序号
+        duplicates = {}  # 首次出现的段落序号 -> 内容和位置相同的其余段落序号（不需要LLM识别）
+        labels = {}  # 不需要LLM识别的段落序号 -> 标记（已确定的类型，或"同N"），发送给LLM时只作上下文
+        
+        rule_results = classify_paragraphs(paragraph_texts)
+        for index, text in enumerate(paragraph_texts):
+            para_type, confidence = rule_results[index]
+            if confidence >= CONFIDENCE_THRESHOLD:
+                rule_items.append({"index": index, "type": para_type})
+                labels[index] = para_type
                 continue
             
-            # 跳过图片段落
-            if has_image(para):
-                continue
+            signature = paragraph_signature(text, index, len(paragraph_texts))
+            para_type = template_cache.lookup(signature) if template_cache is not None and signature else None
+            if para_type:
+                cached_items.append({"index": index, "type": para_type})
+                labels[index] = para_type
+            else:
+                # 文档内重复的段落（如反复出现的小标题）只发送第一次出现的
+                key = (text, paragraph_position(index, len(paragraph_texts)))
+                first_index = first_occurrence.get(key)
+                if first_index is not None:
+                    duplicates.setdefault(first_index, []).append(index)
+                    labels[index] = f'同{first_index}'
+                    continue
+                first_occurrence[key] = index
+                pending_paragraphs.append((index, text))
+                pending_signatures[index] = signature
+        
+        if rule_items:
+            log(f"  📐 规则识别 {len(rule_items)} 个段落")
+        if cached_items:
+            log(f"  ♻️  模板缓存命中 {len(cached_items)} 个段落")
+        if duplicates:
+            log(f"  🔁 重复段落 {sum(map(len, duplicates.values()))} 个，沿用首次出现时的识别结果")
+        
+        if pending_paragraphs:
+            # 4. 检查 Ollama 连接
+            log("  🔍 检查 Ollama 服务...")
+            client = OllamaClient(log=log)
+            success, message = client.check_connection()
+            log(f"     {message}")
             
-            text = para.text.strip()
-            if text:
-                paragraphs_text.append({
-                    "index": len(paragraphs_text),
-                    "content": text
-                })
-        
-        if len(paragraphs_text) == 0:
-            raise Exception("文档中没有有效文本内容")
-        
-        print(f"     提取了 {len(paragraphs_text)} 个有效段落")
-        
-        # 构建发送给 LLM 的文本
-        document_text = "\n".join([f"{p['index']}: {p['content']}" for p in paragraphs_text])
-        
-        # 3. 调用 LLM 识别
-        print("  🤖 调用本地 Qwen 模型分析文档结构...")
-        print("     (这可能需要10-60秒，请耐心等待)")
-        
-        llm_result = client.analyze_document(document_text)
-        
-        print(f"  ✅ LLM识别完成")
-        
-        # 4. 验证 LLM 结果
-        if not validate_llm_result(llm_result, doc):
-            raise Exception("LLM识别结果验证失败")
+            if not success:
+                raise Exception("Ollama 连接失败，请确保 Ollama 已启动并安装了 qwen2.5:7b 模型")
+            
+            # 5. 调用 LLM 识别
+            log("  🤖 调用本地 Qwen 模型分析文档结构...")
+            log("     (这可能需要10-60秒，请耐心等待)")
+            
+            # 发送全部段落（已确定类型的段落带标记，只作上下文），只采用待识别段落的结果
+            llm_result = client.analyze_lines(list(enumerate(paragraph_texts)), labels)
+            
+            log(f"  ✅ LLM识别完成")
+            stats = client.last_stats
+            if stats:
+                # 流式读取提前结束时没有输入token数
+                prompt_info = f"输入 {stats['prompt_tokens']} tokens，" if stats['prompt_tokens'] else ""
+                log(f"     {prompt_info}输出 {stats['output_tokens']} tokens，"
+                      f"生成速度 {stats['tokens_per_second']:.1f} tokens/s，总耗时 {stats['total_seconds']:.1f}s")
+            
+            # 模型漏掉（或改了行号）的待识别段落按正文处理，与不调用LLM时一致
+            returned_indices = {item['index'] for item in llm_result['paragraphs']}
+            missing_indices = {index for index, _ in pending_paragraphs if index not in returned_indices}
+            if missing_indices:
+                log(f"  ⚠️  LLM未返回 {len(missing_indices)} 个段落的类型，按正文处理")
+                llm_result['paragraphs'].extend({"index": index, "type": "body"} for index in sorted(missing_indices))
+            
+            # 6. 验证 LLM 结果
+            if not validate_llm_result(llm_result, doc, log):
+                raise Exception("LLM识别结果验证失败")
+            
+            # 同一段落给出了不同类型时才视为识别失败
+            types_by_index = {}
+            for item in llm_result['paragraphs']:
+                if types_by_index.setdefault(item['index'], item['type']) != item['type']:
+                    raise Exception(f"LLM对第 {item['index']} 段给出了不同的类型")
+            
+            # 验证通过后把本次识别结果写回模板缓存（只记录LLM实际返回的段落）
+            if template_cache is not None:
+                for item in llm_result['paragraphs']:
+                    index = item['index']
+                    if index not in missing_indices and pending_signatures.get(index):
+                        template_cache.record(pending_signatures[index], item['type'])
+                template_cache.save()
+            
+            # 重复段落沿用首次出现段落的识别结果
+            if duplicates:
+                llm_result['paragraphs'].extend([
+                    {"index": duplicate_index, "type": item['type']}
+                    for item in llm_result['paragraphs']
+                    if isinstance(item['index'], int)
+                    for duplicate_index in duplicates.get(item['index'], ())
+                ])
+            
+            llm_result['paragraphs'].extend(rule_items)
+            llm_result['paragraphs'].extend(cached_items)
+        else:
+            log("  ✅ 所有段落均已由规则或模板缓存识别，跳过LLM调用")
+            llm_result = {"paragraphs": rule_items + cached_items, "attachment_start_index": -1}
         
-        # 5. 设置页边距（GB/T 9704-2012标准）
+        # 7. 设置页边距（GB/T 9704-2012标准）
         section = doc.sections[0]
         section.top_margin = Cm(3.7)
         section.bottom_margin = Cm(3.5)
         section.left_margin = Cm(2.8)
         section.right_margin = Cm(2.6)
-        print("  ✅ 页边距: 上3.7cm 下3.5cm 左2.8cm 右2.6cm")
+        log("  ✅ 页边距: 上3.7cm 下3.5cm 左2.8cm 右2.6cm")
         
-        # 6. 根据 LLM 结果应用格式
-        print("  🎨 根据 LLM 识别结果应用格式...")
-        apply_formats_by_llm(doc, llm_result)
+        # 8. 根据 LLM 结果应用格式
+        log("  🎨 根据 LLM 识别结果应用格式...")
+        apply_formats_by_llm(doc, llm_result, para_map, image_paragraphs, log)
         
-        # 7. 保存文档
-        dir_name = os.path.dirname(input_path)
-        base_name = os.path.basename(input_path)
-        output_path = os.path.join(dir_name, f"llm_{base_name}")
+        # 9. 保存文档
+        if output_path is None:
+            dir_name = os.path.dirname(input_path)
+            base_name = os.path.basename(input_path)
+            output_path = os.path.join(dir_name, f"llm_{base_name}")
         
-        print(f"  💾 保存文档...")
+        log(f"  💾 保存文档...")
         doc.save(output_path)
         
-        print("━" * 50)
-        print(f"✅ [LLM模式] 处理完成！")
-        print(f"📁 输出文件: {output_path}\n")
+        log("━" * 50)
+        log(f"✅ [LLM模式] 处理完成！")
+        log(f"📁 输出文件: {output_path}\n")
         
         return True
         
     except Exception as e:
-        print(f"❌ [LLM模式] 处理失败: {str(e)}")
+        log(f"❌ [LLM模式] 处理失败: {str(e)}")
         import traceback
         traceback.print_exc()
         return False
 
 
+def llm_format_documents(input_paths):
+    """批量 LLM 增强格式化：多个文档同时处理，返回与 input_paths 一一对应的处理结果
+    
+    各文档的识别请求使用相同的Prompt前缀，Ollama 可复用前缀缓存；
+    每个文档的输出先缓存起来，处理完后按输入顺序打印
+    """
+    template_cache = TemplateCache() if CACHE_CONFIG["enabled"] else None
+    
+    def format_one(input_path):
+        buffer = io.StringIO()
+        log = functools.partial(print, file=buffer)
+        return llm_format_document(input_path, template_cache=template_cache, log=log), buffer.getvalue()
+    
+    results = []
+    with ThreadPoolExecutor(max_workers=OLLAMA_CONFIG["parallel_documents"]) as executor:
+        futures = [executor.submit(format_one, path) for path in input_paths]
+        for future in futures:
+            success, output = future.result()
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            results.append(success)
+    return results
+
+
 def main():
-    """命令行测试入口"""
+    """命令行测试入口（命令行参数给出多个文档时批量处理）"""
+    if len(sys.argv) > 1:
+        file_paths = []
+        for arg in sys.argv[1:]:
+            file_path = clean_input_path(arg)
+            if not os.path.exists(file_path):
+                print(f"❌ 文件不存在: {file_path}")
+            elif not file_path.lower().endswith('.docx'):
+                print(f"❌ 只支持.docx格式的文件: {file_path}")
+            else:
+                file_paths.append(file_path)
+        if file_paths:
+            results = llm_format_documents(file_paths)
+            print(f"📊 批量处理完成：成功 {sum(results)}/{len(results)} 个文档\n")
+        return
+    
     print("\n" + "=" * 50)
     print("  🤖 公文格式调整工具 - LLM增强版")
     print("=" * 50)
@@ -277,11 +412,7 @@ def main():
                 break
             
             # 处理路径
-            file_path = user_input.strip('"').strip("'").strip()
-            file_path = file_path.replace('\\ ', ' ')
-            file_path = file_path.replace('\\(', '(').replace('\\)', ')')
-            file_path = file_path.replace('\\[', '[').replace('\\]', ']')
-            file_path = file_path.replace('\\&', '&')
+            file_path = clean_input_path(user_input)
             
             if not file_path:
                 continue
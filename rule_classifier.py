@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+规则预分类 - LLM增强版
+编号标题、附件标记、日期等格式固定的段落用正则直接确定类型，只有规则无法确定的段落才交给LLM
+"""
+
+import re
+
+
+# 规则匹配即可确定类型的段落（置信度1.0）
+HEADING1 = re.compile(r'^[一二三四五六七八九十]+、')  # 一级标题：一、
+HEADING2 = re.compile(r'^（[一二三四五六七八九十]+）')  # 二级标题：（一）
+HEADING3 = re.compile(r'^\d{1,2}\.(?!\d)')  # 三级标题：1.（排除"1.5亿元"这类小数）
+HEADING4 = re.compile(r'^\(\d{1,2}\)')  # 四级标题：(1)
+ATTACHMENT_MARKER = re.compile(r'^附件(?:\d+|[一二三四五六七八九十]+)?[：:]?$')  # 单独一行的附件标记
+DATE = re.compile(
+    r'^(?:\d{4}年\d{1,2}月\d{1,2}日'
+    r'|[〇○零一二三四五六七八九十]{4}年[一二三四五六七八九十]+月[一二三四五六七八九十]+日)$'
+)  # 整段只有日期
+
+CONFIDENCE_THRESHOLD = 0.9  # 置信度达到该值的段落不再发送给LLM
+
+# 按顺序匹配，先匹配到的类型优先
+_RULES = (
+    (ATTACHMENT_MARKER, 'attachment_marker'),
+    (DATE, 'date'),
+    (HEADING1, 'heading1'),
+    (HEADING2, 'heading2'),
+    (HEADING3, 'heading3'),
+    (HEADING4, 'heading4'),
+)
+
+# 所有规则合并成一个正则（命名分组即类型），每个段落只匹配一次；
+# 各规则都锚定在段首，分支按 _RULES 的顺序尝试，结果与逐条匹配相同
+_COMBINED = re.compile('|'.join(
+    f'(?P<{para_type}>{pattern.pattern[1:]})' for pattern, para_type in _RULES
+))
+
+
+def classify_paragraph(text):
+    """用规则判断段落类型，返回 (类型, 置信度)；规则无法确定时返回 (None, 0.0)"""
+    match = _COMBINED.match(text)
+    if match:
+        return match.lastgroup, 1.0
+    return None, 0.0
+
+
+def classify_paragraphs(texts):
+    """批量判断段落类型，返回与 texts 一一对应的 (类型, 置信度) 列表"""
+    match = _COMBINED.match
+    results = []
+    for text in texts:
+        m = match(text)
+        results.append((m.lastgroup, 1.0) if m else (None, 0.0))
+    return results
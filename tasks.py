@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务队列 - Web版
+耗时的格式化处理在后台进程池中执行（绕开GIL，多核并行），请求线程只负责提交任务和查询状态
+"""
+
+import io
+import os
+import time
+import uuid
+import functools
+import shutil
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from docx import Document
+
+# 导入核心格式化函数
+from config import OLLAMA_CONFIG
+from gongwen_formatter_cli import format_document
+from llm_formatter import llm_format_document
+from llm_client import PROMPT_DIGEST, result_cache_key
+
+# 任务状态（沿用Celery的状态名，前端据此轮询）
+PENDING = 'PENDING'
+STARTED = 'STARTED'
+SUCCESS = 'SUCCESS'
+FAILURE = 'FAILURE'
+
+TASK_WORKERS = os.cpu_count() or 4  # 同时处理的文档数（子进程数）
+TASK_TTL = 3600  # 已完成任务的状态保留时间（秒）
+CACHE_DIR_NAME = 'gongwen_cache'  # 结果缓存目录（位于上传目录下，便于硬链接）
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # 结果缓存的总大小上限（上传目录通常在 /dev/shm，占用的是内存）
+FORMATTER_VERSION = 1  # 排版规则版本：修改格式化规则后递增，使旧的结果缓存失效
+
+# 结果缓存按类型附加的版本标识：原版格式化只取决于排版规则，LLM增强还取决于模型和Prompt
+_CACHE_VERSIONS = {
+    'done': f'v{FORMATTER_VERSION}',
+    'llm': f'v{FORMATTER_VERSION}_{result_cache_key(OLLAMA_CONFIG["model"], PROMPT_DIGEST)[:16]}',
+}
+
+_executor = None  # 进程池，首次使用时创建
+_executor_lock = threading.Lock()
+_worker_warm = False  # 子进程内：预热是否成功
+_ready = False  # 格式化流程是否已确认可用（启动预热成功，或有任务正常完成）
+_tasks = {}  # task_id -> (future, 提交时间)
+_tasks_lock = threading.Lock()
+
+
+def remove_file(path):
+    """删除文件，文件不存在或无法删除时忽略"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _link_or_copy(src, dst):
+    """硬链接文件（不支持时复制）"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _cache_path(upload_folder, content_key, kind):
+    """结果缓存文件路径：<上传内容SHA-256>_<类型>_<版本标识>.docx"""
+    if content_key is None:
+        return None
+    return os.path.join(upload_folder, CACHE_DIR_NAME, f'{content_key}_{kind}_{_CACHE_VERSIONS[kind]}.docx')
+
+
+def _load_cached(cache_path, final_output):
+    """命中缓存时把缓存结果放到输出位置，返回是否命中"""
+    if cache_path is None or not os.path.exists(cache_path):
+        return False
+    try:
+        _link_or_copy(cache_path, final_output)
+        os.utime(cache_path)  # 更新修改时间，清理时按最近使用保留
+        return True
+    except OSError:
+        return False
+
+
+def _store_cached(final_output, cache_path):
+    """把生成的结果存入缓存，总大小超出上限时删除最久未用的文件"""
+    if cache_path is None:
+        return
+    cache_dir = os.path.dirname(cache_path)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _link_or_copy(final_output, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        remove_file(tmp_path)
+        return
+
+    try:
+        entries = [(entry.path, entry.stat()) for entry in os.scandir(cache_dir) if entry.name.endswith('.docx')]
+        total_bytes = sum(stat.st_size for _, stat in entries)
+        if total_bytes > CACHE_MAX_BYTES:
+            entries.sort(key=lambda entry: entry[1].st_mtime)
+            for path, stat in entries:
+                if total_bytes <= CACHE_MAX_BYTES:
+                    break
+                os.remove(path)
+                total_bytes -= stat.st_size
+    except OSError:
+        pass
+
+
+def format_task(temp_input, mode, tag, filename, upload_folder, content_key=None):
+    """格式化任务：按模式生成文档，返回与原 /upload 接口相同结构的结果
+
+    content_key 为上传内容的SHA-256，相同内容的文档直接复用缓存结果
+    """
+    results = []
+    error_messages = []
+
+    with contextlib.ExitStack() as cleanup:
+        # 无论处理成功与否，结束时都删除上传的临时文件
+        cleanup.callback(remove_file, temp_input)
+
+        # 模式1: 原有格式化
+        if mode in ['original', 'both']:
+            print("\n" + "="*60)
+            print("开始原有格式化...")
+            print("="*60)
+            try:
+                # 直接保存到最终位置，不经过中间文件
+                final_output = os.path.join(upload_folder, f'done_{tag}_{filename}')
+                cache_path = _cache_path(upload_folder, content_key, 'done')
+                if _load_cached(cache_path, final_output):
+                    print("♻️  相同文档已处理过，使用缓存结果")
+                    success_original = True
+                else:
+                    success_original = format_document(temp_input, final_output)
+                    if success_original and os.path.exists(final_output):
+                        _store_cached(final_output, cache_path)
+                if success_original:
+                    # 检查文件是否存在
+                    if os.path.exists(final_output):
+                        results.append({
+                            'type': 'original',
+                            'download_url': f'/download/{os.path.basename(final_output)}',
+                            'filename': f'done_{filename}'
+                        })
+                        print(f"✅ 原版格式化完成: {final_output}")
+                    else:
+                        error_messages.append("原版格式化: 输出文件未生成")
+                else:
+                    error_messages.append("原版格式化: 处理失败")
+            except Exception as e:
+                error_messages.append(f"原版格式化失败: {str(e)}")
+                print(f"❌ 原版格式化失败: {str(e)}")
+
+        # 模式2: LLM增强格式化
+        if mode in ['llm', 'both']:
+            print("\n" + "="*60)
+            print("开始LLM增强格式化...")
+            print("="*60)
+            try:
+                # 直接保存到最终位置，不经过中间文件
+                final_output = os.path.join(upload_folder, f'llm_{tag}_{filename}')
+                cache_path = _cache_path(upload_folder, content_key, 'llm')
+                if _load_cached(cache_path, final_output):
+                    print("♻️  相同文档已处理过，使用缓存结果")
+                    success_llm = True
+                else:
+                    success_llm = llm_format_document(temp_input, final_output)
+                    if success_llm and os.path.exists(final_output):
+                        _store_cached(final_output, cache_path)
+                if success_llm:
+                    # 检查文件是否存在
+                    if os.path.exists(final_output):
+                        results.append({
+                            'type': 'llm',
+                            'download_url': f'/download/{os.path.basename(final_output)}',
+                            'filename': f'llm_{filename}'
+                        })
+                        print(f"✅ LLM增强版完成: {final_output}")
+                    else:
+                        error_messages.append("LLM增强: 输出文件未生成")
+                else:
+                    error_messages.append("LLM增强: 处理失败")
+            except Exception as e:
+                error_messages.append(f"LLM增强失败: {str(e)}")
+                print(f"❌ LLM增强失败: {str(e)}")
+
+    # 判断处理结果
+    if len(results) == 0:
+        # 完全失败
+        error_msg = "处理失败: " + "; ".join(error_messages)
+        return {'success': False, 'error': error_msg}
+    elif len(error_messages) > 0:
+        # 部分失败（双模式时）
+        warning_msg = "部分成功: " + "; ".join(error_messages)
+        print(f"⚠️  {warning_msg}")
+
+    return {
+        'success': True,
+        'files': results,
+        'warnings': error_messages if len(error_messages) > 0 else None
+    }
+
+
+def warm_up():
+    """预热格式化流程：用单段落文档完整跑一遍，提前完成模板加载、正则编译等初始化"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        warmup_path = os.path.join(tmp_dir, 'warmup.docx')
+        doc = Document()
+        doc.add_paragraph('关于预热格式化流程的通知')
+        doc.save(warmup_path)
+        
+        # 预热输出不打印到控制台
+        with contextlib.redirect_stdout(io.StringIO()):
+            return format_document(warmup_path)
+
+
+def _init_worker():
+    """进程池子进程初始化：每个子进程启动时各自预热一次"""
+    global _worker_warm
+    try:
+        _worker_warm = warm_up()
+    except Exception:
+        _worker_warm = False
+
+
+def _worker_ready():
+    """在子进程中执行，返回该子进程的预热结果"""
+    return _worker_warm
+
+
+def _get_executor():
+    """获取进程池（首次调用时创建）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                # forkserver 预先导入本模块（python-docx、格式化模块），子进程从它fork，启动开销小
+                ctx = multiprocessing.get_context('forkserver')
+                ctx.set_forkserver_preload([__name__])
+            else:
+                # Windows 只支持 spawn
+                ctx = multiprocessing.get_context('spawn')
+            _executor = ProcessPoolExecutor(max_workers=TASK_WORKERS, mp_context=ctx,
+                                            initializer=_init_worker)
+        return _executor
+
+
+def _reset_executor(broken):
+    """丢弃已损坏的进程池（子进程被杀死，如处理大文档时内存不足），换一个新的进程池并在后台预热"""
+    global _executor, _ready
+    with _executor_lock:
+        reset = _executor is broken
+        if reset:
+            _executor = None
+            _ready = False
+    broken.shutdown(wait=False)
+    if reset:
+        # 新进程池预热成功后重新标记为就绪，空闲的实例不必等到有用户任务才恢复
+        _get_executor().submit(_worker_ready).add_done_callback(_record_warm_up)
+
+
+def _discard_if_broken(executor, future):
+    """任务因进程池损坏而失败时丢弃该进程池"""
+    if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+        _reset_executor(executor)
+
+
+def _submit(fn, *args):
+    """提交到进程池；进程池已损坏时换一个新的进程池重试一次"""
+    executor = _get_executor()
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenProcessPool:
+        print("⚠️  格式化进程池已损坏，重新创建进程池")
+        _reset_executor(executor)
+        executor = _get_executor()
+        future = executor.submit(fn, *args)
+    future.add_done_callback(functools.partial(_discard_if_broken, executor))
+    return future
+
+
+def start_workers():
+    """创建进程池并等待一个子进程完成预热，返回预热结果"""
+    # spawn 方式的子进程启动时会重新导入主模块（进而导入app.py），子进程中不再创建进程池
+    if multiprocessing.current_process().name != 'MainProcess':
+        return False
+    future = _submit(_worker_ready)
+    future.add_done_callback(_record_warm_up)
+    try:
+        return future.result()
+    except Exception as e:
+        # 预热失败不影响服务启动
+        print(f"⚠️  格式化进程池预热失败: {e}")
+        return False
+
+
+def _record_warm_up(future):
+    """预热完成时记录：子进程预热成功，说明格式化流程可用"""
+    global _ready
+    if not future.cancelled() and future.exception() is None and future.result():
+        _ready = True
+
+
+def _record_task(future):
+    """任务完成时记录：子进程正常返回结果，说明格式化流程可用"""
+    global _ready
+    if not future.cancelled() and future.exception() is None:
+        _ready = True
+
+
+def check_ready():
+    """就绪检查：格式化流程已确认可用（启动预热成功，或有任务正常完成）且进程池未损坏
+    
+    不向进程池提交任何任务，繁忙的实例不会因为检查排在用户任务后面而被判为未就绪；
+    进程池损坏（提交或执行任务时抛出 BrokenProcessPool）后重建的新进程池
+    在预热成功或有任务正常完成之前返回未就绪
+    """
+    with _executor_lock:
+        return _executor is not None and _ready
+
+
+def shutdown_workers():
+    """关闭进程池（等待已提交的任务完成）"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _prune_tasks(now):
+    """清理过期的已完成任务，避免状态表无限增长"""
+    expired = [task_id for task_id, (future, created) in _tasks.items()
+               if future.done() and now - created > TASK_TTL]
+    for task_id in expired:
+        del _tasks[task_id]
+
+
+def submit_task(*args):
+    """提交格式化任务，立即返回任务ID"""
+    task_id = uuid.uuid4().hex
+    future = _submit(format_task, *args)
+    future.add_done_callback(_record_task)
+    now = time.monotonic()
+    with _tasks_lock:
+        _prune_tasks(now)
+        _tasks[task_id] = (future, now)
+    return task_id
+
+
+def get_task_status(task_id):
+    """查询任务状态，返回 (state, result)；任务不存在时返回 (None, None)"""
+    with _tasks_lock:
+        entry = _tasks.get(task_id)
+    if entry is None:
+        return None, None
+
+    future = entry[0]
+    if future.running():
+        return STARTED, None
+    if not future.done():
+        return PENDING, None
+
+    error = future.exception()
+    if error is not None:
+        return FAILURE, {'success': False, 'error': f'服务器错误: {str(error)}'}
+    return SUCCESS, future.result()
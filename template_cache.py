@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+段落模板缓存 - LLM增强版
+按段落的签名（编号前缀、长度区间、结尾标点、所在位置，无编号的短段落还包括内容的摘要）记录LLM识别出的段落类型，
+同一签名被LLM多次确认为同一类型后直接复用，不再发送给LLM；命中的段落按一定比例仍交给LLM重新确认
+"""
+
+import os
+import re
+import json
+import random
+import hashlib
+import threading
+import contextlib
+from bisect import bisect_right
+from itertools import islice
+from config import CACHE_CONFIG
+
+# 文件锁：Unix 用 fcntl，Windows 用 msvcrt
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+# 段落开头的编号（只区分种类，不区分具体数字）
+_NUMBERING_TOKEN_RE = re.compile(
+    r'^(?:(?P<h1>[一二三四五六七八九十]+、)'  # 一级：一、
+    r'|(?P<h2>（[一二三四五六七八九十]+）)'  # 二级：（一）
+    r'|(?P<h3>\d+\.)'  # 三级：1.
+    r'|(?P<h4>\(\d+\)))'  # 四级：(1)
+    r'|(?P<att>附件[\d一二三四五六七八九十]*[：:]?)'  # 附件标记
+)
+_LENGTH_BOUNDS = (10, 20, 40, 80)  # 长度区间分界
+_TAIL_PUNCTUATION = '：:。；;，,'  # 记入签名的结尾标点
+_DATE_RE = re.compile(r'\d{4}年\d{1,2}月\d{1,2}日|[〇○零一二三四五六七八九十]{4}年')
+_EDGE_PARAGRAPHS = 3  # 文档开头/结尾各多少段视为"首部"/"尾部"（标题、主送机关、署名、日期所在位置）
+_CONTENT_MAX_LENGTH = 20  # 不超过该长度的无编号段落，内容（数字归一）的摘要也记入签名
+_DIGITS_RE = re.compile(r'\d+')
+# 当前格式的签名（编号|长度区间|结尾标点|日期|位置|内容摘要），加载时丢弃旧格式（含原文）的条目
+_SIGNATURE_RE = re.compile(r'^[^|]*\|\d\|[^|]?\|D?\|(?:head|mid|tail)\|(?:[0-9a-f]{16})?$')
+
+
+def paragraph_position(index, total):
+    """段落所在位置：head（开头几段）、tail（结尾几段）或 mid"""
+    if index < _EDGE_PARAGRAPHS:
+        return 'head'
+    if index >= total - _EDGE_PARAGRAPHS:
+        return 'tail'
+    return 'mid'
+
+
+def paragraph_signature(text, index, total):
+    """计算段落的签名；没有编号的长段落无法仅凭结构区分类型，返回None（不使用缓存）
+    
+    无编号的短段落（如"加强组织领导"、"特此通知"）结构完全相同，签名中带上内容的摘要，
+    只有同样的文字才复用类型；缓存文件中不保存文档原文
+    """
+    match = _NUMBERING_TOKEN_RE.match(text)
+    token = match.lastgroup if match else ''
+    if token:
+        content = ''
+    elif len(text) <= _CONTENT_MAX_LENGTH:
+        content = hashlib.blake2b(_DIGITS_RE.sub('0', text).encode('utf-8'), digest_size=8).hexdigest()
+    else:
+        return None
+    length_bucket = bisect_right(_LENGTH_BOUNDS, len(text))
+    tail = text[-1] if text[-1] in _TAIL_PUNCTUATION else ''
+    date = 'D' if _DATE_RE.search(text) else ''
+    position = paragraph_position(index, total)
+    return f'{token}|{length_bucket}|{tail}|{date}|{position}|{content}'
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """独占文件锁：多个进程保存同一个缓存文件时依次进行"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _add_counts(templates, signature, counts):
+    """把 {类型: 次数} 累加到 templates[signature]"""
+    merged = templates.setdefault(signature, {})
+    for para_type, hits in counts.items():
+        merged[para_type] = merged.get(para_type, 0) + hits
+
+
+class TemplateCache:
+    """签名 -> {段落类型: LLM确认次数}，以JSON文件保存在磁盘上（可在多个线程间共用）
+    
+    条目按最近使用排列，超过 max_entries 时删除最久未用的；
+    保存时在文件锁内重新读取文件，合并本次新增的确认次数后再写回，多个进程的记录不会互相覆盖
+    """
+
+    def __init__(self, path=None):
+        self.path = path or CACHE_CONFIG["template_cache_path"]
+        self.min_hits = CACHE_CONFIG["min_hits"]
+        self.min_ratio = CACHE_CONFIG["min_ratio"]
+        self.verify_ratio = CACHE_CONFIG["verify_ratio"]
+        self.max_entries = CACHE_CONFIG["template_cache_max_entries"]
+        self._lock = threading.Lock()
+        self._pending = {}  # 上次保存后新增的确认次数：签名 -> {类型: 次数}
+        self._touched = {}  # 上次保存后用到的签名（按使用顺序），保存时移到最近使用的位置
+        self.templates = self._load()
+
+    def _load(self):
+        """读取缓存文件；文件不存在或已损坏时返回空缓存"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                templates = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(templates, dict):
+            return {}
+        return {signature: counts for signature, counts in templates.items()
+                if _SIGNATURE_RE.match(signature) and isinstance(counts, dict)}
+
+    def _touch(self, signature):
+        self._touched.pop(signature, None)
+        self._touched[signature] = None
+
+    def lookup(self, signature):
+        """返回该签名可直接复用的段落类型；确认次数不足或类型不一致时返回None
+        
+        可复用时仍按 verify_ratio 的概率返回None，让LLM重新识别并记录，错误的缓存类型因此会被纠正
+        """
+        with self._lock:
+            counts = self.templates.get(signature)
+            if not counts:
+                return None
+            total = sum(counts.values())
+            para_type, hits = max(counts.items(), key=lambda item: item[1])
+            if hits >= self.min_hits and hits / total >= self.min_ratio:
+                self._touch(signature)
+            else:
+                return None
+        if random.random() >= self.verify_ratio:
+            return para_type
+        return None
+
+    def record(self, signature, para_type):
+        """记录一次LLM识别结果"""
+        with self._lock:
+            _add_counts(self.templates, signature, {para_type: 1})
+            _add_counts(self._pending, signature, {para_type: 1})
+            self._touch(signature)
+
+    def save(self):
+        """写回磁盘：文件锁内重新读取、合并新增记录、淘汰最久未用的条目，再先写临时文件后替换"""
+        with self._lock:
+            if not self._pending and not self._touched:
+                return
+            pending, touched = self._pending, self._touched
+            self._pending, self._touched = {}, {}
+        
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with _file_lock(f'{self.path}.lock'):
+                # 其他进程可能已保存过新的记录，以文件中的最新内容为准
+                templates = self._load()
+                for signature, counts in pending.items():
+                    _add_counts(templates, signature, counts)
+                for signature in touched:
+                    if signature in templates:
+                        templates[signature] = templates.pop(signature)
+                excess = len(templates) - self.max_entries
+                if excess > 0:
+                    for signature in list(islice(templates, excess)):
+                        del templates[signature]
+                
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(templates, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            # 保存失败时保留新增记录，下次保存时重试
+            with self._lock:
+                for signature, counts in pending.items():
+                    _add_counts(self._pending, signature, counts)
+                for signature in touched:
+                    self._touch(signature)
+            return
+        
+        with self._lock:
+            # 保存期间其他线程新增的记录仍在 _pending 中，合并进来
+            for signature, counts in self._pending.items():
+                _add_counts(templates, signature, counts)
+            self.templates = templates
@@ -77,10 +77,12 @@ try:
         
         # 显示前3个段落的识别结果
         print("\n   🔍 前3个段落识别详情:")
+        test_lines = test_doc.split('\n')
         for p in paragraphs[:3]:
             idx = p.get('index', '?')
             ptype = p.get('type', 'unknown')
-            content = p.get('content', '')[:30]
+            # 模型只返回行号和类型，内容从测试文档中取
+            content = test_lines[idx].split(': ', 1)[-1][:30] if isinstance(idx, int) and 0 <= idx < len(test_lines) else ''
             print(f"      [{idx}] {ptype}: {content}...")
         
         # 验证识别准确性
@@ -17,7 +17,7 @@ if errorlevel 1 (
 
 REM 检查依赖
 echo 🔍 检查依赖...
-python -c "import flask" >nul 2>&1
+python -c "import flask, psutil" >nul 2>&1
 if errorlevel 1 (
     echo 📦 安装依赖...
     pip install -r requirements_web.txt